@@ -1,8 +1,18 @@
 import requests
 import os
 import json
+import time
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from lib.http_client import HttpClient
 
 class DownloadStep:
+    # ハッシュを照合する場合に files の各要素で指定できるキー（先に見つかったものを使う）
+    CHECKSUM_KEYS = ('sha256', 'sha1', 'md5')
+
     def __init__(self, name, step_type, step_config):
         self.name = name
         self.step_type = step_type
@@ -12,25 +22,225 @@ class DownloadStep:
         self.download_dir = step_config['output_dir']
         # ダウンロードディレクトリが存在しない場合は作成
         os.makedirs(self.download_dir, exist_ok=True)
+        # 同時にダウンロードするファイル数
+        self.workers = int(step_config.get('workers', 4))
+        # 失敗したダウンロード（接続エラー、5xx、429）をやり直す回数と、やり直すまでの秒数（回数に応じて倍にする）
+        self.max_retries = int(step_config.get('max_retries', 3))
+        self.retry_delay = float(step_config.get('retry_delay', 1.0))
+        self.chunk_size = int(step_config.get('chunk_size', 64 * 1024))
+        # ダウンロード結果の一覧（JSON）
+        self.summary_file = step_config.get('summary_file', os.path.join(self.download_dir, 'download_summary.json'))
+        # URLごとの ETag / Last-Modified / サイズ / sha256。保存済みのファイルは条件付きGETで取得し、変化が無ければ取り直さない
+        self.manifest_file = step_config.get('manifest_file', os.path.join(self.download_dir, 'download_manifest.json'))
+        self.manifest = self.load_manifest()
+        self.manifest_lock = threading.Lock()
+        # 同じホストからの連続したダウンロードでは接続を使い回す（プールの大きさは同時ダウンロード数以上にする）
+        self.http = HttpClient(pool_maxsize=int(step_config.get('pool_maxsize', max(self.workers, 10))))
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_manifest(self):
+        # 同じ manifest を使う他のプロセスと一時ファイルが重ならないよう mkstemp で作成する
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(self.manifest_file)}.", suffix='.tmp',
+                                        dir=os.path.dirname(self.manifest_file) or '.')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # 前回ダウンロードしたファイルが残っていれば、前回の ETag / Last-Modified で条件付きGETのヘッダを作成する
+    def conditional_headers(self, url, save_path):
+        entry = self.manifest.get(url)
+        if not entry or not os.path.exists(save_path) or os.path.getsize(save_path) != entry.get('size'):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @classmethod
+    def expected_checksum(cls, file):
+        for algorithm in cls.CHECKSUM_KEYS:
+            if file.get(algorithm):
+                return algorithm, file[algorithm].strip().lower()
+        return None, None
+
+    @staticmethod
+    def hash_file(path, algorithm, chunk_size=1024 * 1024):
+        digest = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest
 
-    def download_file(self, url, save_path):
-        """指定されたURLからファイルをダウンロードし、指定されたパスに保存する"""
+    @staticmethod
+    def load_part_info(info_path):
         try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()  # ステータスコードが200以外の場合は例外を発生させる
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+            with open(info_path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    # 途中まで書き込んだ .part とその ETag / Last-Modified を削除する
+    @staticmethod
+    def discard_part(part_path, info_path):
+        for path in (part_path, info_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def download_file(self, url, save_path, algorithm='sha256', expected=None, conditional=True):
+        """指定されたURLからファイルをダウンロードし、指定されたパスに保存する
+
+        ダウンロード中は {save_path}.part に書き込み、完了してハッシュを照合してから保存先に移動する。
+        前回の実行で途中まで書き込んだ .part がある場合は Range で続きから取得する
+        （If-Range に前回の ETag / Last-Modified を付け、サーバー側のファイルが変わっていれば最初から取得する）。
+        .part の ETag / Last-Modified が記録されていない場合と、416 (Range Not Satisfiable) の場合は
+        続きが同じファイルのものか確かめられないため、.part を削除して最初から取得する。
+        保存済みのファイルは manifest の ETag / Last-Modified で条件付きGETを行い、304 の場合は取得しない
+        （保存済みのファイルのハッシュが一致しない場合は、条件を付けずに取得し直す）。
+        戻り値は (状態, バイト数, ハッシュ値, 応答ヘッダ)。状態は downloaded / resumed / not_modified。
+        ハッシュが一致しない場合は ValueError
+        """
+        part_path = f"{save_path}.part"
+        info_path = f"{part_path}.json"
+        headers = {}
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = None
+        if offset:
+            info = self.load_part_info(info_path)
+            validator = info.get('etag') or info.get('last_modified')
+            if not validator:
+                self.discard_part(part_path, info_path)
+                offset = 0
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = validator
+        elif conditional:
+            headers = self.conditional_headers(url, save_path)
+        with self.http.get(url, headers=headers, stream=True) as response:
+            response_headers = response.headers
+            if response.status_code == 304 and not offset:
+                digest = self.hash_file(save_path, algorithm).hexdigest()
+                if expected and digest != expected:
+                    # 保存済みのファイルが壊れている（または期待するハッシュが変わった）ため、304 を返さないよう条件を外す
+                    print(f"{algorithm} mismatch for {save_path} (not modified on the server), downloading again")
+                    return self.download_file(url, save_path, algorithm, expected, conditional=False)
+                return 'not_modified', self.manifest[url]['size'], digest, response_headers
+            if response.status_code == 416 and offset:
+                # .part がサーバー側のファイルより長い（ファイルが変わった）ため、最初から取得し直す
+                self.discard_part(part_path, info_path)
+                return self.download_file(url, save_path, algorithm, expected)
+            response.raise_for_status()  # ステータスコードが200番台以外の場合は例外を発生させる
+            mode = 'ab' if response.status_code == 206 and offset else 'wb'
+            if mode == 'wb':
+                offset = 0
+                with open(info_path, 'w') as f:
+                    json.dump({'url': url, 'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')}, f)
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
                     f.write(chunk)
-            print(f"File downloaded successfully: {save_path}")
-        except requests.RequestException as e:
-            print(f"Failed to download {url}: {e}")
+        digest = self.hash_file(part_path, algorithm).hexdigest()
+        if expected and digest != expected:
+            self.discard_part(part_path, info_path)
+            raise ValueError(f"{algorithm} mismatch: expected {expected}, got {digest}")
+        size = os.path.getsize(part_path)
+        os.replace(part_path, save_path)
+        if os.path.exists(info_path):
+            os.remove(info_path)
+        return ('resumed' if offset else 'downloaded'), size, digest, response_headers
 
-    def execute(self):
-        """ダウンロードステップを実行する"""
+    @staticmethod
+    def is_retryable(error):
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        # ハッシュの不一致（途中で内容が変わった場合など）は最初から取り直す
+        return isinstance(error, (requests.RequestException, ValueError))
 
-        for file in self.config_json['files']:
-            url = file['url']
-            filename = file['filename']
-            save_path = os.path.join(self.download_dir, filename)
-            self.download_file(url, save_path)
+    def download(self, file):
+        """1ファイル分のダウンロード（失敗した場合は max_retries 回までやり直す）"""
+        url = file['url']
+        filename = file['filename']
+        save_path = os.path.join(self.download_dir, filename)
+        algorithm, expected = self.expected_checksum(file)
+        result = {'url': url, 'filename': filename, 'status': 'failed', 'attempts': 0}
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            result['attempts'] = attempt + 1
+            try:
+                status, size, digest, headers = self.download_file(url, save_path, algorithm or 'sha256', expected)
+                result.update({'status': status, 'bytes': size, algorithm or 'sha256': digest, 'verified': bool(expected)})
+                result['change'] = self.update_manifest(url, filename, save_path, size, headers,
+                                                        digest if (algorithm or 'sha256') == 'sha256' else None)
+                result.pop('error', None)
+                if status == 'not_modified':
+                    print(f"File not modified: {save_path}")
+                else:
+                    print(f"File downloaded successfully: {save_path} ({result['change']})")
+                break
+            except (requests.RequestException, ValueError, OSError) as e:
+                result['error'] = str(e)
+                if attempt < self.max_retries and self.is_retryable(e):
+                    time.sleep(self.retry_delay * 2 ** attempt)
+                    continue
+                print(f"Failed to download {url}: {e}")
+                break
+        result['elapsed'] = round(time.perf_counter() - start, 3)
+        return result
 
+    # manifest を更新し、前回からの変化（new / changed / unchanged）を返す
+    def update_manifest(self, url, filename, save_path, size, headers, sha256=None):
+        sha256 = sha256 or self.hash_file(save_path, 'sha256').hexdigest()
+        with self.manifest_lock:
+            previous = self.manifest.get(url)
+            entry = dict(previous or {})
+            entry.update({'filename': filename, 'size': size, 'sha256': sha256})
+            # 304 の応答には ETag / Last-Modified が含まれない場合があるため、含まれる場合のみ更新する
+            if headers.get('ETag'):
+                entry['etag'] = headers['ETag']
+            if headers.get('Last-Modified'):
+                entry['last_modified'] = headers['Last-Modified']
+            if not previous or previous.get('sha256') != sha256:
+                entry['updated_at'] = datetime.now(timezone.utc).isoformat()
+            self.manifest[url] = entry
+        if not previous:
+            return 'new'
+        return 'unchanged' if previous.get('sha256') == sha256 else 'changed'
+
+    def write_summary(self, results, elapsed):
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        summary = {
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'elapsed': round(elapsed, 3),
+            'workers': self.workers,
+            'counts': counts,
+            'bytes': sum(result.get('bytes', 0) for result in results if result['status'] != 'not_modified'),
+            # 前回から新規・更新されたファイル（後続のステップはこのファイルだけを処理すればよい）
+            'changed': [result['filename'] for result in results if result.get('change') in ('new', 'changed')],
+            'files': results
+        }
+        with open(self.summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"Downloads: {len(results)} files in {elapsed:.1f} s {counts}, "
+              f"{len(summary['changed'])} new or changed (see {self.summary_file})")
+
+    def execute(self):
+        """ダウンロードステップを実行する（workers 件ずつ並行してダウンロードする）"""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.download, self.config_json['files']))
+        self.save_manifest()
+        self.write_summary(results, time.perf_counter() - start)
+        self.http.print_summary()
@@ -1,43 +1,281 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, unquote
+from urllib.parse import urlparse, unquote
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import asyncio
+import time
 import os
 import hashlib
-import time
-import random
 import mimetypes
-import chardet
-import urllib.robotparser
+import tempfile
 import json  # Ensure json is imported
+from lib.http_client import HttpClient
+from lib.robots_cache import RobotsCache
+from lib.crawl_frontier import CrawlFrontier
+from lib.shared_frontier import SharedFrontier
+from lib.crawl_journal import CrawlJournal
+from lib.charset_detector import CharsetDetector
+from lib.link_extractor import create_link_extractor
+from lib.page_store import PageStore, open_page
+from lib.crawl_scope import CrawlScope, SitemapReader
+from lib.rate_limiter import AdaptiveRateLimiter
+from lib.url_canonicalizer import UrlCanonicalizer
+from lib.warc_archive import WarcWriter, worker_path
+from lib.crawl_metrics import CrawlMetrics
+
+# ホスト単位で同時接続数とリクエストレートを制御する
+class HostLimiter:
+    def __init__(self, per_host_concurrency, rate_limiter):
+        self.per_host_concurrency = per_host_concurrency
+        self.rate_limiter = rate_limiter
+        self.semaphores = {}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = urlparse(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        async with self.semaphores[host]:
+            # ホストごとのトークンバケットで決まる時刻まで待つ
+            wait = self.rate_limiter.reserve(url)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
 
 class WebScraperStep:
-    def __init__(self, step_config):
+    # http / rate_limiter / download_dir / metrics は複数サイトを同時にクロールする場合（multi_site_scraper_step）に
+    # 共有のHTTPクライアント・レート制限・サイトごとの保存先・計測値を渡すために使う
+    def __init__(self, step_config, http=None, rate_limiter=None, download_dir=None, metrics=None):
         self.start_url = step_config['start_url']
         self.user_agent = step_config['user_agent']
         self.output_dir = step_config['output_dir']
         self.progress_file = step_config['progress_file']
         self.save_every = step_config['save_every']
-        self.visited = self.load_progress()
+        # 非同期クロールの設定（concurrency が 1 の場合は従来の逐次クロール）
+        self.concurrency = int(step_config.get('concurrency', 1))
+        self.per_host_concurrency = int(step_config.get('per_host_concurrency', 2))
+        # ホストごとのリクエストレート。host_delay 秒に1回から始め、応答時間と 429/503 に応じて
+        # rate_limit_min 〜 rate_limit_max (リクエスト/秒) の範囲で調整する
+        self.owns_rate_limiter = rate_limiter is None
+        self.rate_limiter = rate_limiter or self.create_rate_limiter(step_config)
+        # 429/503 が返ったURLを後で取り直す回数
+        self.max_retries = int(step_config.get('max_retries', 3))
+        self.retries = {}
+        # 接続を使い回すHTTPクライアント（プールの大きさは同時リクエスト数以上にする）
+        self.owns_http = http is None
+        self.http = http or HttpClient(
+            self.user_agent,
+            pool_connections=int(step_config.get('pool_connections', 10)),
+            pool_maxsize=int(step_config.get('pool_maxsize', max(self.concurrency, 10))),
+            timeout=float(step_config.get('http_timeout', 30)),
+            max_timings=int(step_config.get('http_max_timings', 10000)))
+        # 保存先（既定では環境変数 OUTPUT_DIR）
+        self.download_dir = download_dir or os.getenv('OUTPUT_DIR', './output')
+        self.timing_file = step_config.get('timing_file')
+        # 取得時間・バイト数・ステータス等の計測値。metrics_file（Prometheus のテキスト形式）に metrics_interval 秒ごとに
+        # 書き出す、または metrics_port の HTTP エンドポイントで公開する
+        self.owns_metrics = metrics is None
+        self.metrics = metrics or CrawlMetrics()
+        self.metrics_file = step_config.get('metrics_file')
+        self.metrics_port = step_config.get('metrics_port')
+        self.metrics_interval = float(step_config.get('metrics_interval', 10))
+        # テキスト以外（PDF、Excel、画像など）の応答はチャンク単位でファイルに書き出す。max_download_size バイトを超える応答は保存しない
+        self.max_download_size = int(step_config.get('max_download_size', 50 * 1024 * 1024))
+        self.download_chunk_size = int(step_config.get('download_chunk_size', 64 * 1024))
+        # 文字コード判定（Content-Type → <meta charset> → chardet の順）
+        self.charset_detector = CharsetDetector(
+            sniff_bytes=int(step_config.get('charset_sniff_bytes', 4096)),
+            detect_bytes=int(step_config.get('charset_detect_bytes', 32768)))
+        self.detected_charsets = {}
+        self.charset_methods = {}
+        # リンク抽出に使うパーサー（auto: selectolax → lxml → bs4 の順にインストール済みのもの）
+        self.link_extractor = create_link_extractor(step_config.get('link_extractor', 'auto'))
+        # page_store_dir を指定した場合はページを内容のハッシュ単位で圧縮保存する（同じ内容は1回だけ保存）
+        page_store_dir = step_config.get('page_store_dir')
+        self.page_store = PageStore(page_store_dir, step_config.get('page_store_compression', 'auto')) if page_store_dir else None
+        # robots.txt はホストごとにキャッシュし、progress_file と同じ場所に保存する
+        robots_cache_file = step_config.get('robots_cache_file', f"{os.path.splitext(self.progress_file)[0]}_robots.json")
+        self.robots = RobotsCache(self.user_agent, robots_cache_file, int(step_config.get('robots_ttl', 86400)), http=self.http)
+        # クロール範囲（include / exclude の正規表現、開始URLからの深さの上限）
+        max_depth = step_config.get('max_depth')
+        self.scope = CrawlScope(
+            include_patterns=step_config.get('include_patterns'),
+            exclude_patterns=step_config.get('exclude_patterns'),
+            max_depth=int(max_depth) if max_depth is not None else None)
+        # キューに追加する前にURLを正規化し、#付き・ホスト名の大文字小文字違いなどの重複を1つにまとめる
+        # （クエリの並べ替え・index.html の除去などURLを書き換えるルールは指定した場合のみ）
+        if step_config.get('canonicalize_urls', True):
+            self.canonicalizer = UrlCanonicalizer(
+                drop_fragment=step_config.get('canonical_drop_fragment', True),
+                query=step_config.get('canonical_query', 'keep'),
+                strip_params=step_config.get('canonical_strip_params'),
+                index_documents=step_config.get('canonical_index_documents'),
+                trailing_slash=step_config.get('canonical_trailing_slash', 'keep'))
+        else:
+            self.canonicalizer = None
+        # sitemap: yes の場合は robots.txt の Sitemap: 行（無ければ /sitemap.xml）、リストの場合は指定したサイトマップからURLを追加する
+        self.sitemap = step_config.get('sitemap', False)
         self.counter = 0
-        progress_data = self.load_progress()
+        # 非同期クロールでは進行状況の書き出しをスレッドプールで行う（書き出し中は次の書き出しを行わない）
+        self.save_executor = None
+        self.pending_save = None
+        # shared_frontier を指定した場合は複数のワーカープロセスで同じサイトをクロールする
+        # （未訪問URL・進行状況は共有のデータベースに記録するため、journal_file は使わない）
+        shared_frontier = step_config.get('shared_frontier')
+        self.shared_frontier = bool(shared_frontier)
+        # journal_file を指定した場合は進行状況を追記専用のジャーナルに記録する
+        journal_file = step_config.get('journal_file')
+        self.journal = CrawlJournal(journal_file) if journal_file and not shared_frontier else None
+        if shared_frontier:
+            self.frontier = SharedFrontier(
+                shared_frontier,
+                worker_id=step_config.get('worker_id'),
+                lease=float(step_config.get('frontier_lease', 300)),
+                poll_interval=float(step_config.get('frontier_poll_interval', 1.0)),
+                priority=step_config.get('frontier_priority', 'fifo'),
+                priority_patterns=step_config.get('frontier_priority_patterns'))
+            progress_data = self.frontier.progress_data()
+            # 共有キューが空の場合（最初のワーカー）は progress.json の状態から始める
+            if not progress_data['visited'] and not progress_data['to_visit']:
+                progress_data = self.load_progress()
+                self.frontier.import_progress(progress_data)
+        elif self.journal and self.journal.exists():
+            progress_data = self.journal.replay()
+        else:
+            progress_data = self.load_progress()
+        # warc_file を指定した場合は取得した応答をヘッダ・ステータス・取得時刻ごと WARC に保存する（CDX 索引付き）
+        # shared_frontier の場合は他のワーカーと同じファイルに追記しないよう、WARC / CDX のファイル名にワーカーIDを付ける
+        warc_file = step_config.get('warc_file')
+        warc_cdx_file = step_config.get('warc_cdx_file')
+        if warc_file and shared_frontier:
+            warc_file = worker_path(warc_file, self.frontier.worker_id)
+            warc_cdx_file = worker_path(warc_cdx_file, self.frontier.worker_id) if warc_cdx_file else None
+        self.warc = WarcWriter(warc_file, warc_cdx_file) if warc_file else None
         self.visited = progress_data.get('visited', {})
-        self.to_visit = progress_data.get('to_visit', [self.start_url])
+        # URLごとの ETag / Last-Modified / 内容のハッシュ / 保存ファイル / 開始URLからの深さ（再クロール時の条件付きGETと深さの復元に使用）
+        self.validators = progress_data.get('validators', {})
+        # 今回のクロールで新規取得・内容が変化したURL
+        self.changed = progress_data.get('changed', [])
+        to_visit = progress_data.get('to_visit', [self.start_url])
+        # 再クロール: 前回のクロールが完了していれば、前回訪問したURLを起点に取り直す
+        # （共有キューの場合はデータベースを削除して始める）
+        if step_config.get('recrawl', False) and self.visited and not to_visit and not shared_frontier:
+            # 前回の深さで取り直し、max_depth を超えるリンクを展開しないようにする（深さを記録していない場合は 0）
+            to_visit = [self.start_url] + [url for url in self.visited if url != self.start_url]
+            progress_data['to_visit_depth'] = [0] + [self.validators.get(url, {}).get('depth', 0) for url in to_visit[1:]]
+            self.visited = {}
+            self.changed = []
+        # 未訪問URLのキュー。訪問済み・キュー投入済みのURLは二度追加しない
+        if not shared_frontier:
+            self.frontier = CrawlFrontier(
+                priority=step_config.get('frontier_priority', 'fifo'),
+                priority_patterns=step_config.get('frontier_priority_patterns'),
+                memory_limit=int(step_config.get('frontier_memory_limit', 100000)),
+                spill_dir=step_config.get('frontier_spill_dir', f"{os.path.splitext(self.progress_file)[0]}_frontier"))
+        # 訪問済みURLも未訪問URLと同じく正規化した形で登録する（前回と正規化の設定が異なる場合も重複して取得しない）
+        for url in self.visited:
+            self.frontier.mark_seen(self.canonicalizer.register(url) if self.canonicalizer else url)
+        to_visit_depth = progress_data.get('to_visit_depth', [0] * len(to_visit))
+        self.add_metrics_gauges()
+        for url, depth in zip(to_visit, to_visit_depth):
+            self.frontier.push(self.canonicalizer.canonicalize(url) if self.canonicalizer else url, depth)
+        self.in_flight = {}
+        self.total_urls = 0
+        self.completed_urls = 0
+        # 開始時点の状態でジャーナルを作り直す（progress.json からの移行・再クロールの初期化を兼ねる）
+        if self.journal:
+            self.journal.rewrite(self.get_progress_data())
 
-    def save_progress(self):
-        progress_data = {
+    @staticmethod
+    def create_rate_limiter(step_config):
+        host_delay = float(step_config.get('host_delay', 1.0))
+        return AdaptiveRateLimiter(
+            initial_rate=1 / host_delay if host_delay > 0 else float(step_config.get('rate_limit_max', 2.0)),
+            min_rate=float(step_config.get('rate_limit_min', 0.1)),
+            max_rate=float(step_config.get('rate_limit_max', 2.0)),
+            latency_target=float(step_config.get('rate_limit_latency', 2.0)))
+
+    # キューの長さ・取得中・訪問済みのURL数をサイトごとのゲージとして登録する
+    def add_metrics_gauges(self):
+        site = (('site', urlparse(self.start_url).netloc),)
+        self.metrics.add_gauge('queue_depth', 'URLs waiting in the frontier', lambda: {site: len(self.frontier)})
+        self.metrics.add_gauge('in_flight', 'URLs being fetched', lambda: {site: len(self.in_flight)})
+        self.metrics.add_gauge('visited', 'URLs fetched and saved', lambda: {site: len(self.visited)})
+        if self.owns_rate_limiter:
+            self.metrics.add_rate_limiter(self.rate_limiter)
+
+    def get_progress_data(self):
+        # 共有キューの場合は全ワーカーの進行状況（他のワーカーが取得中のURLは未訪問として扱う）
+        if self.shared_frontier:
+            return self.frontier.progress_data()
+        # 取得中のURLは再開時にやり直せるよう未訪問として保存
+        pending = list(self.in_flight.items()) + list(self.frontier.pending())
+        return {
             'visited': self.visited,
-            'to_visit': self.to_visit
+            'to_visit': [url for url, _ in pending],
+            'to_visit_depth': [depth for _, depth in pending],
+            'validators': self.validators,
+            'changed': self.changed
         }
-        with open(self.progress_file, 'w') as file:
+
+    # progress_data を指定しない場合は現在の状態を保存する
+    def save_progress(self, progress_data=None):
+        if self.page_store:
+            self.page_store.flush()
+        if self.warc:
+            self.warc.flush()
+        # 共有キューは取得ごとにデータベースへ記録済み
+        if self.shared_frontier:
+            return
+        # ジャーナル使用時は記録済みの操作をファイルに書き出すだけでよい
+        if self.journal:
+            self.journal.flush()
+            return
+        if progress_data is None:
+            progress_data = self.get_progress_data()
+        tmp_file = f"{self.progress_file}.tmp"
+        with open(tmp_file, 'w') as file:
             json.dump(progress_data, file, indent=2)
+        os.replace(tmp_file, self.progress_file)
+
+    # 別のスレッドで書き出すための、現在の進行状況の複製（書き出し中にイベントループで変更されないようにする）
+    def progress_snapshot(self):
+        if self.shared_frontier or self.journal:
+            return None
+        progress_data = self.get_progress_data()
+        progress_data['visited'] = dict(progress_data['visited'])
+        progress_data['validators'] = {url: dict(validator) for url, validator in progress_data['validators'].items()}
+        progress_data['changed'] = list(progress_data['changed'])
+        return progress_data
+
+    # save_every 件ごとの保存。非同期クロールではイベントループを止めないようスレッドプールで書き出し、
+    # 前回の書き出しが終わっていない場合は次の機会に回す
+    def request_save(self):
+        if self.save_executor is None:
+            self.save_progress()
+        elif self.pending_save is None or self.pending_save.done():
+            self.pending_save = self.save_executor.submit(self.save_progress, self.progress_snapshot())
+        else:
+            return False
+        return True
+
+    # クロール終了時に後続ステップ向けの progress.json を書き出す
+    def finish_progress(self):
+        if self.shared_frontier:
+            self.frontier.export(self.progress_file)
+            return
+        if self.journal:
+            self.journal.rewrite(self.get_progress_data())
+        with open(self.progress_file, 'w') as file:
+            json.dump(self.get_progress_data(), file, indent=2)
 
     # 対象がスクレイピングOKか確認
     def is_allowed_url(self, url):
-        parser = urllib.robotparser.RobotFileParser()
-        parser.set_url(urllib.parse.urljoin(url, '/robots.txt'))
-        parser.read()
-        return parser.can_fetch(self.user_agent, url)
-   
+        allowed = self.robots.can_fetch(url)
+        if not allowed:
+            self.metrics.record_robots_denied(url)
+        return allowed
+
     # 進行状況を取得
     def load_progress(self):
         if os.path.exists(self.progress_file):
@@ -46,76 +284,406 @@ class WebScraperStep:
         return {}
 
     # URLからファイルの拡張子を推定する関数
-    def get_extension_from_url(self, url):
+    def get_extension_from_url(self, url, content_type=''):
         parsed_url = urlparse(unquote(url))
         _, ext = os.path.splitext(parsed_url.path)
-        return ext if ext else '.html'  # デフォルトは .html
+        if ext:
+            return ext
+        # URLに拡張子が無いバイナリは Content-Type から推定する
+        if content_type and not self.is_text_content_type(content_type):
+            guessed = mimetypes.guess_extension(content_type.split(';')[0].strip())
+            if guessed:
+                return guessed
+        return '.html'  # デフォルトは .html
+
+    # HTML などテキストとして扱う Content-Type か（未指定の場合もテキストとして扱う）
+    @staticmethod
+    def is_text_content_type(content_type):
+        media_type = content_type.split(';')[0].strip().lower()
+        return (not media_type or media_type.startswith('text/') or media_type.endswith('+xml')
+                or media_type in ('application/xml', 'application/json', 'application/javascript'))
 
-    # 
+    def get_save_path(self, url, extension):
+        url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
+        return f"{self.download_dir}/{url_hash}{extension}"
+
+    # 文字コード判定済みのテキストを UTF-8 で保存する
     def save_page_content(self, url, content, response):
-        # ファイル拡張子取得
-        content_type = response.headers.get('Content-Type', '')
         extension = self.get_extension_from_url(url)
-        # 保存先パスを作成
-        url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
-        download_dir = os.getenv('OUTPUT_DIR', './output')
-        filename = f"{download_dir}/{url_hash}{extension}"
-        # 保存
-        mode = 'wb' if content_type.startswith('image/') else 'w'
-        with open(filename, mode, encoding='utf-8' if mode == 'w' else None) as file:
-            file.write(content if mode == 'w' else response.content)
-        # 完了履歴の追加
+        if self.page_store:
+            filename = self.page_store.put(url, content.encode('utf-8'), extension)
+        else:
+            filename = self.get_save_path(url, extension)
+            with open(filename, 'w', encoding='utf-8') as file:
+                file.write(content)
+        print(f"Saved {url} as {filename}")
+        return filename
+
+    # テキスト以外の応答をメモリに読み込まず、チャンク単位で一時ファイルに書き出してから保存先に移動する
+    # （保存したファイルのパス、内容の sha256、バイト数を返す）
+    def save_binary_content(self, url, response):
+        extension = self.get_extension_from_url(url, response.headers.get('Content-Type', ''))
+        sha256 = hashlib.sha256()
+        size = 0
+
+        def chunks():
+            nonlocal size
+            for chunk in response.iter_content(self.download_chunk_size):
+                size += len(chunk)
+                if size > self.max_download_size:
+                    raise ValueError(f"Response exceeds max_download_size ({self.max_download_size} bytes)")
+                sha256.update(chunk)
+                yield chunk
+
+        try:
+            if self.page_store:
+                filename = self.page_store.put_stream(url, chunks(), extension)
+            else:
+                filename = self.get_save_path(url, extension)
+                fd, tmp_filename = tempfile.mkstemp(prefix=f"{os.path.basename(filename)}.", suffix='.tmp',
+                                                    dir=os.path.dirname(filename) or '.')
+                try:
+                    with os.fdopen(fd, 'wb') as file:
+                        for chunk in chunks():
+                            file.write(chunk)
+                    os.replace(tmp_filename, filename)
+                except BaseException:
+                    if os.path.exists(tmp_filename):
+                        os.remove(tmp_filename)
+                    raise
+        finally:
+            response.close()
         print(f"Saved {url} as {filename}")
+        return filename, sha256.hexdigest(), size
+
+    # キューから取り出したURLが訪問済みの場合は取得せず、前回の保存先で完了として記録する
+    # （共有キューでは割り当てを解除し、他のワーカーが期限切れを待って取り直さないようにする）
+    def skip_visited(self, url):
+        self.frontier.complete(url, self.visited[url], self.validators.get(url), url in self.changed)
+
+    # 完了履歴の追加
+    def mark_visited(self, url, filename, changed=False):
         self.visited[url] = filename
-        
+        self.frontier.complete(url, filename, self.validators.get(url), changed)
+        if self.journal:
+            self.journal.append('visit', url=url, file=filename, validator=self.validators.get(url), changed=changed)
+
         # counterをインクリメントして、指定された数ごとに進行状況を保存
         self.counter += 1
-        if self.counter >= self.save_every:
-            self.save_progress()
+        if self.counter >= self.save_every and self.request_save():
             self.counter = 0  # カウンターをリセット
-   
+
+    # 取得しなかったURL（robots.txtで不許可、エラー等）を記録する
+    def mark_dropped(self, url):
+        self.frontier.drop(url)
+        if self.journal:
+            self.journal.append('drop', url=url)
+
+    # 429/503 が返ったURLをキューの末尾に戻す（max_retries 回まで）
+    def retry_later(self, url, depth):
+        self.retries[url] = self.retries.get(url, 0) + 1
+        if self.retries[url] > self.max_retries:
+            self.mark_dropped(url)
+            return
+        self.frontier.requeue(url, depth)
+        if self.journal:
+            self.journal.append('enqueue', url=url, depth=depth)
+
+    def enqueue(self, url, depth):
+        if self.canonicalizer:
+            url = self.canonicalizer.canonicalize(url)
+        if url in self.frontier or not self.scope.allows(url, depth):
+            return False
+        if not self.frontier.push(url, depth):
+            return False
+        if self.journal:
+            self.journal.append('enqueue', url=url, depth=depth)
+        return True
+
+    # サイトマップに記載された開始URLと同じホストのURLを、開始URLと同じ深さ(0)で追加する
+    # （再開時は追加済みのため、訪問済みのURLが無い場合のみ）
+    def seed_from_sitemaps(self):
+        if not self.sitemap or self.visited:
+            return
+        if isinstance(self.sitemap, list):
+            sitemap_urls = self.sitemap
+        else:
+            sitemap_urls = SitemapReader.default_sitemaps(self.start_url, self.robots.get_parser(self.start_url))
+        netloc = urlparse(self.start_url).netloc
+        reader = SitemapReader(self.http)
+        added = 0
+        for url in reader.read(sitemap_urls):
+            if urlparse(url).netloc == netloc and self.enqueue(url, 0):
+                added += 1
+        print(f"Sitemap: {added} URLs added from {reader.fetched} sitemaps")
+
     def print_progress(self, completed, total):
         if total > 0:
             progress_percentage = (completed / total) * 100
             print(f"Progress: {completed}/{total} ({progress_percentage:.2f}%) completed.", end='\r')
- 
-    def scrape_site(self):
-        total_urls = len(self.to_visit) + len(self.visited)  # 最初の総URL数
-        completed_urls = len(self.visited)  # 最初の完了URL数
-    
-        download_dir = os.getenv('OUTPUT_DIR', './output')
+
+    # ページを取得し、文字コードを判定する
+    # 応答は stream=True で受け取り、Content-Type がテキスト以外であれば本文を読み込まずに
+    # save_binary_content でファイルへ書き出す（response.saved_file に保存先が入る）
+    def fetch_page(self, url):
+        fetched_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        try:
+            response = self.http.get(url, headers=self.conditional_headers(url), stream=True)
+        except Exception:
+            self.rate_limiter.record(url, None, None)
+            self.metrics.record_error(url)
+            raise
+        self.rate_limiter.record(url, response.status_code, response.elapsed.total_seconds(), response.headers.get('Retry-After'))
+        response.saved_file = None
+        content_length = int(response.headers.get('Content-Length', 0) or 0)
+        if content_length > self.max_download_size:
+            response.close()
+            raise ValueError(f"Content-Length {content_length} exceeds max_download_size ({self.max_download_size} bytes)")
+        if response.status_code == 200 and not self.is_text_content_type(response.headers.get('Content-Type', '')):
+            response.saved_file, response.sha256, size = self.save_binary_content(url, response)
+            self.metrics.record_fetch(url, response.status_code, time.perf_counter() - start, size)
+            if self.warc:
+                self.warc.write_exchange(url, response, response.saved_file, fetched_at, opener=open_page)
+            return response
+        response.sha256 = hashlib.sha256(response.content).hexdigest()
+        self.metrics.record_fetch(url, response.status_code, time.perf_counter() - start, len(response.content))
+        if response.status_code != 304:
+            encoding, method = self.charset_detector.detect(url, response.content, response.headers.get('Content-Type', ''))
+            response.encoding = encoding
+            self.detected_charsets[url] = (encoding, method)
+            if self.warc:
+                self.warc.write_exchange(url, response, response.content, fetched_at, charset=encoding)
+        return response
+
+    # 前回取得時の ETag / Last-Modified から条件付きGETのヘッダを作成する
+    def conditional_headers(self, url):
+        validator = self.validators.get(url)
+        if not validator or not os.path.exists(validator['filename']):
+            return {}
+        headers = {}
+        if validator.get('etag'):
+            headers['If-None-Match'] = validator['etag']
+        if validator.get('last_modified'):
+            headers['If-Modified-Since'] = validator['last_modified']
+        return headers
+
+    # 304 が返った、もしくは内容のハッシュが前回と同じ場合は未変更とみなす
+    def is_unchanged(self, url, response):
+        validator = self.validators.get(url)
+        if not validator or not os.path.exists(validator['filename']):
+            return False
+        if response.status_code == 304:
+            return True
+        return response.status_code == 200 and validator.get('sha256') == response.sha256
+
+    def update_validator(self, url, response, filename, depth):
+        validator = self.validators.setdefault(url, {})
+        validator['filename'] = filename
+        validator['depth'] = depth
+        if response.headers.get('ETag'):
+            validator['etag'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validator['last_modified'] = response.headers['Last-Modified']
+        if response.status_code == 200:
+            validator['sha256'] = response.sha256
+        # 文字コードとその判定方法
+        if url in self.detected_charsets:
+            validator['encoding'], validator['charset_method'] = self.detected_charsets.pop(url)
+            self.charset_methods[validator['charset_method']] = self.charset_methods.get(validator['charset_method'], 0) + 1
+
+    # 未変更のページは保存・リンク抽出を行わず、前回のファイルをそのまま使う
+    def handle_unchanged(self, url, depth, response):
+        filename = self.validators[url]['filename']
+        self.update_validator(url, response, filename, depth)
+        self.mark_visited(url, filename)
+        self.completed_urls += 1
+        self.print_progress(self.completed_urls, self.total_urls)
+
+    # ページ内のリンクのうち、開始URLと同じホストのものを絶対URLで返す
+    def extract_links(self, url, response):
+        if response.saved_file:
+            return []
+        start = time.perf_counter()
+        links = self.link_extractor.extract_links(url, response.text, urlparse(self.start_url).netloc)
+        self.metrics.record_parse(url, time.perf_counter() - start)
+        return links
+
+    # 取得済みページを保存し、保存先を返す（バイナリは取得時に保存済み）
+    def save_page(self, url, response):
+        return response.saved_file or self.save_page_content(url, response.text, response)
+
+    # 取得済みページを保存し、未訪問のリンクを追加する
+    # （非同期クロールでは保存を save_page でスレッドプールで行い、filename に保存先を渡す）
+    def handle_page(self, url, depth, response, links, filename=None):
+        if filename is None:
+            filename = self.save_page(url, response)
+        self.update_validator(url, response, filename, depth)
+        self.changed.append(url)
+        self.mark_visited(url, filename, changed=True)
+        self.completed_urls += 1  # 完了カウントをインクリメント
+        for absolute_link in links:
+            if self.enqueue(absolute_link, depth + 1):
+                self.total_urls += 1
+        self.print_progress(self.completed_urls, self.total_urls)  # 進捗表示の更新
+
+    # クロール開始前の準備（サイトマップからのURL追加、進捗の初期値、保存先の作成）
+    def prepare_crawl(self):
+        self.seed_from_sitemaps()
+        self.total_urls = len(self.frontier) + len(self.visited)  # 最初の総URL数
+        self.completed_urls = len(self.visited)  # 最初の完了URL数
         # Ensure the download directory exists
-        os.makedirs(download_dir, exist_ok=True)
+        os.makedirs(self.download_dir, exist_ok=True)
+        if self.owns_metrics:
+            self.metrics.export(self.metrics_file, self.metrics_port, self.metrics_interval)
 
-   
-        while self.to_visit:
-            current_url = self.to_visit.pop(0)
-            if not current_url or current_url in self.visited or not self.is_allowed_url(current_url):
+    def scrape_site(self):
+        self.prepare_crawl()
+
+        while self.frontier or self.frontier.wait_for_work():
+            try:
+                current_url, depth = self.frontier.pop()
+            except IndexError:
+                # 共有キューで他のワーカーが先に取得した
                 continue
-    
+            if current_url in self.visited:
+                self.skip_visited(current_url)
+                continue
+
             try:
-                time.sleep(random.uniform(0.5, 1.5))  # Random delay to reduce server load
-                response = requests.get(current_url, headers={'User-Agent': self.user_agent})
-                detected_encoding = chardet.detect(response.content)['encoding']
-                response.encoding = detected_encoding
-
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    self.save_page_content(current_url, response.text, response)
-                    completed_urls += 1  # 完了カウントをインクリメント
-                    self.print_progress(completed_urls, total_urls)  # 進捗表示の更新
-    
-                    for link in soup.find_all('a', href=True):
-                        absolute_link = urljoin(current_url, link['href'])
-                        if absolute_link not in self.visited and urlparse(absolute_link).netloc == urlparse(self.start_url).netloc:
-                            self.to_visit.append(absolute_link)
-    
+                if not self.is_allowed_url(current_url):
+                    self.mark_dropped(current_url)
+                    continue
+                self.rate_limiter.acquire(current_url)  # ホストごとのレート制限
+                response = self.fetch_page(current_url)
+
+                if self.is_unchanged(current_url, response):
+                    self.handle_unchanged(current_url, depth, response)
+                elif response.status_code == 200:
+                    links = self.extract_links(current_url, response)
+                    self.handle_page(current_url, depth, response, links)
+                elif response.status_code in (429, 503):
+                    self.retry_later(current_url, depth)
+                else:
+                    self.mark_dropped(current_url)
+
             except Exception as e:
                 print(f"Error scraping {current_url}: {e}")
+                self.mark_dropped(current_url)
                 continue
 
-        print("\nScraping completed.")  # 最後に改行を入れて終了メッセージを表示 
-    def execute(self):
-        self.scrape_site()
+        self.finish_crawl()
+
+    # 1URL分の取得処理。ネットワークI/O・HTML解析・ファイルの保存はスレッドプールで実行する
+    # limiter でホストごとの同時接続数・レートを待ってから取得する（全体の同時リクエスト数はスレッドプールの大きさで決まる）
+    async def scrape_url_async(self, url, depth, executor, limiter, dispatch):
+        loop = asyncio.get_running_loop()
+        try:
+            allowed = await loop.run_in_executor(executor, self.is_allowed_url, url)
+            if not allowed:
+                self.mark_dropped(url)
+                return
+            async with limiter.slot(url):
+                response = await loop.run_in_executor(executor, self.fetch_page, url)
+            if self.is_unchanged(url, response):
+                self.handle_unchanged(url, depth, response)
+            elif response.status_code == 200:
+                links = await loop.run_in_executor(executor, self.extract_links, url, response)
+                filename = await loop.run_in_executor(executor, self.save_page, url, response)
+                self.handle_page(url, depth, response, links, filename)
+            elif response.status_code in (429, 503):
+                self.retry_later(url, depth)
+            else:
+                self.mark_dropped(url)
+        except Exception as e:
+            print(f"Error scraping {url}: {e}")
+            self.mark_dropped(url)
+        finally:
+            self.in_flight.pop(url, None)
+            dispatch.release()
+
+    # このサイトのURLを同時に concurrency 件まで処理する
+    # executor / limiter は複数サイトで共有できる
+    async def crawl_async(self, executor, limiter):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self.prepare_crawl)
+        self.save_executor = executor
+        try:
+            await self.dispatch_async(executor, limiter)
+        finally:
+            # 書き出し中の進行状況を待つ（以降の保存は finish_crawl で行う）
+            if self.pending_save is not None:
+                await asyncio.wrap_future(self.pending_save)
+            self.save_executor = None
+            self.pending_save = None
 
+    async def dispatch_async(self, executor, limiter):
+        loop = asyncio.get_running_loop()
+        dispatch = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        while True:
+            if not self.frontier:
+                if tasks:
+                    # 取得中のページから新しいリンクが追加されるのを待つ
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                # 共有キューでは他のワーカーが取得中のページから新しいリンクが追加されるのを待つ
+                if await loop.run_in_executor(executor, self.frontier.wait_for_work):
+                    continue
+                break
+            await dispatch.acquire()
+            try:
+                current_url, depth = self.frontier.pop()
+            except IndexError:
+                dispatch.release()
+                continue
+            if current_url in self.visited:
+                self.skip_visited(current_url)
+                dispatch.release()
+                continue
+            self.in_flight[current_url] = depth
+            task = asyncio.ensure_future(self.scrape_url_async(current_url, depth, executor, limiter, dispatch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    # 同時に concurrency 件までリクエストを発行する非同期クロール
+    async def scrape_site_async(self):
+        limiter = HostLimiter(self.per_host_concurrency, self.rate_limiter)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await self.crawl_async(executor, limiter)
 
+        self.finish_crawl()
+
+    def finish_crawl(self):
+        if self.page_store:
+            self.page_store.close()
+        if self.warc:
+            self.warc.close()
+        self.finish_progress()
+        print("\nScraping completed.")  # 最後に改行を入れて終了メッセージを表示
+        print(f"Changed pages: {len(self.changed)} / {len(self.visited)} (see 'changed' in {self.progress_file})")
+        if self.charset_methods:
+            print(f"Charset detection: {self.charset_methods}")
+        if self.page_store:
+            self.page_store.print_summary()
+        if self.canonicalizer:
+            self.canonicalizer.print_summary()
+        self.scope.print_summary()
+        if self.shared_frontier:
+            self.frontier.print_summary()
+            self.frontier.close()
+        # 共有のレート制限・HTTPクライアントは multi_site_scraper_step がまとめて表示する
+        if self.owns_rate_limiter:
+            self.rate_limiter.print_summary()
+        if self.owns_metrics:
+            self.metrics.close()
+        if self.owns_http:
+            self.http.print_summary()
+            if self.timing_file:
+                self.http.write_timings(self.timing_file)
+
+    def execute(self):
+        if self.concurrency > 1:
+            asyncio.run(self.scrape_site_async())
+        else:
+            self.scrape_site()
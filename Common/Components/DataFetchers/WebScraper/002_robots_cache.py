@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import requests
+import urllib.robotparser
+from urllib.parse import urlparse
+
+# robots.txt をホスト(scheme + host)単位でキャッシュする
+#
+# 取得した robots.txt は cache_file に保存し、再開時は ttl 秒以内であれば
+# ネットワークにアクセスせずに再利用する。
+class RobotsCache:
+    # 取得に失敗した場合(5xx, 通信エラー)に再取得するまでの秒数
+    ERROR_TTL = 300
+
+    def __init__(self, user_agent, cache_file=None, ttl=86400, http=None):
+        self.user_agent = user_agent
+        # HttpClient を渡した場合はスクレイピング処理と接続を共有する
+        self.http = http
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.entries = self.load()
+        self.parsers = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.cache_file and os.path.exists(self.cache_file):
+            with open(self.cache_file, 'r') as file:
+                return json.load(file)
+        return {}
+
+    def save(self):
+        if not self.cache_file:
+            return
+        persisted = {key: entry for key, entry in self.entries.items() if entry['status'] != 'error'}
+        # 複数のワーカー（shared_frontier）が同じキャッシュを保存しても一時ファイルが重ならないよう mkstemp で作成する
+        fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(self.cache_file)}.", suffix='.tmp',
+                                        dir=os.path.dirname(self.cache_file) or '.')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(persisted, file, indent=2)
+            os.replace(tmp_file, self.cache_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    @staticmethod
+    def cache_key(url):
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def is_expired(self, entry):
+        ttl = self.ERROR_TTL if entry['status'] == 'error' else self.ttl
+        return time.time() - entry['fetched_at'] > ttl
+
+    # RobotFileParser.read() と同じ基準で robots.txt を解釈する
+    #   401/403 -> 全て不許可, その他の4xx -> 全て許可, 5xx/通信エラー -> 不許可(ERROR_TTL後に再取得)
+    def fetch(self, key):
+        try:
+            url = f"{key}/robots.txt"
+            headers = {'User-Agent': self.user_agent}
+            if self.http:
+                response = self.http.get(url, headers=headers)
+            else:
+                response = requests.get(url, headers=headers, timeout=30)
+        except requests.RequestException as e:
+            print(f"Failed to fetch robots.txt ({key}): {e}")
+            return {'status': 'error', 'fetched_at': time.time()}
+        if response.status_code in (401, 403):
+            status = 'disallow_all'
+        elif 400 <= response.status_code < 500:
+            status = 'allow_all'
+        elif response.status_code >= 500:
+            status = 'error'
+        else:
+            status = 'parsed'
+        entry = {'status': status, 'fetched_at': time.time()}
+        if status == 'parsed':
+            entry['lines'] = response.text.splitlines()
+        return entry
+
+    def build_parser(self, entry):
+        parser = urllib.robotparser.RobotFileParser()
+        if entry['status'] == 'parsed':
+            parser.parse(entry['lines'])
+        elif entry['status'] == 'allow_all':
+            parser.allow_all = True
+        elif entry['status'] == 'disallow_all':
+            parser.disallow_all = True
+        return parser
+
+    def get_parser(self, url):
+        key = self.cache_key(url)
+        parser = self.parsers.get(key)
+        if parser is not None and not self.is_expired(self.entries[key]):
+            return parser
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self.is_expired(entry):
+                entry = self.fetch(key)
+                self.entries[key] = entry
+                self.save()
+            parser = self.build_parser(entry)
+            self.parsers[key] = parser
+        return parser
+
+    def can_fetch(self, url):
+        return self.get_parser(url).can_fetch(self.user_agent, url)
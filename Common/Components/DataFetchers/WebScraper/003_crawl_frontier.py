@@ -0,0 +1,165 @@
+import os
+import re
+import json
+from collections import deque
+
+# 優先度ごとのキュー。メモリ上の件数が上限を超えた分はファイルに退避する
+class FrontierBucket:
+    # 退避ファイルから一度に読み戻す件数
+    REFILL_SIZE = 10000
+
+    def __init__(self, spill_path):
+        self.memory = deque()
+        self.spill_path = spill_path
+        self.spilled = 0
+        self.read_offset = 0
+        # 前回の実行で残った退避ファイルは progress_file から復元するため破棄する
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+    def __len__(self):
+        return len(self.memory) + self.spilled
+
+    def push(self, entry, spill):
+        # 一度退避を始めたら順序を保つため、読み戻しが終わるまで退避ファイルに追記する
+        if self.spilled or spill:
+            with open(self.spill_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.spilled += 1
+        else:
+            self.memory.append(entry)
+
+    def pop(self):
+        if not self.memory and self.spilled:
+            self.refill()
+        return self.memory.popleft()
+
+    def refill(self):
+        with open(self.spill_path, 'r', encoding='utf-8') as file:
+            file.seek(self.read_offset)
+            for _ in range(min(self.REFILL_SIZE, self.spilled)):
+                self.memory.append(tuple(json.loads(file.readline())))
+            self.read_offset = file.tell()
+        self.spilled -= len(self.memory)
+        if not self.spilled:
+            os.remove(self.spill_path)
+            self.read_offset = 0
+
+    def entries(self):
+        yield from self.memory
+        if self.spilled:
+            with open(self.spill_path, 'r', encoding='utf-8') as file:
+                file.seek(self.read_offset)
+                for line in file:
+                    yield tuple(json.loads(line))
+
+    def clear(self):
+        self.memory.clear()
+        if self.spilled:
+            os.remove(self.spill_path)
+        self.spilled = 0
+        self.read_offset = 0
+
+# クロール対象URLのキュー
+#
+# 一度キューに入れたURLと訪問済みURLを seen で管理し、同じURLを二度キューに入れない。
+# priority:
+#   'fifo'    : 追加順（既定）
+#   'depth'   : 開始URLからの深さが浅い順
+#   'pattern' : priority_patterns の先頭に近い正規表現にマッチするURLから順に
+#               （どれにもマッチしないURLは最後）
+class CrawlFrontier:
+    def __init__(self, priority='fifo', priority_patterns=None, memory_limit=100000, spill_dir=None):
+        if priority not in ('fifo', 'depth', 'pattern'):
+            raise ValueError(f"Unknown frontier priority: {priority}")
+        self.priority = priority
+        self.priority_patterns = [re.compile(pattern) for pattern in (priority_patterns or [])]
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.buckets = {}
+        self.seen = set()
+        self.memory_count = 0
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    def __bool__(self):
+        return any(len(bucket) for bucket in self.buckets.values())
+
+    def __contains__(self, url):
+        return url in self.seen
+
+    def priority_of(self, url, depth):
+        if self.priority == 'depth':
+            return depth
+        if self.priority == 'pattern':
+            for index, pattern in enumerate(self.priority_patterns):
+                if pattern.search(url):
+                    return index
+            return len(self.priority_patterns)
+        return 0
+
+    def get_bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            spill_path = os.path.join(self.spill_dir or '.', f"frontier_{key}.jsonl")
+            bucket = FrontierBucket(spill_path)
+            self.buckets[key] = bucket
+        return bucket
+
+    # 訪問済みURLを登録する（キューには入れない）
+    def mark_seen(self, url):
+        self.seen.add(url)
+
+    # 未登録のURLであればキューに追加して True を返す
+    def push(self, url, depth=0):
+        if not url or url in self.seen:
+            return False
+        self.seen.add(url)
+        bucket = self.get_bucket(self.priority_of(url, depth))
+        spill = self.spill_dir is not None and self.memory_count >= self.memory_limit
+        if spill and not bucket.spilled:
+            os.makedirs(self.spill_dir, exist_ok=True)
+        before = len(bucket.memory)
+        bucket.push((url, depth), spill)
+        self.memory_count += len(bucket.memory) - before
+        return True
+
+    # 取り出し済みのURLをもう一度キューに追加する（一時的なエラーで取り直す場合）
+    def requeue(self, url, depth=0):
+        self.seen.discard(url)
+        return self.push(url, depth)
+
+    # 優先度が最も高いURLを (url, depth) で取り出す
+    def pop(self):
+        for key in sorted(self.buckets):
+            bucket = self.buckets[key]
+            if len(bucket):
+                before = len(bucket.memory)
+                entry = bucket.pop()
+                self.memory_count += len(bucket.memory) - before
+                return entry
+        raise IndexError('pop from empty frontier')
+
+    # 取得の完了・中止を記録する（共有キュー SharedFrontier と同じインターフェースにするためのもの。
+    # 単独のクロールでは訪問済みURLを WebScraperStep の visited で管理する）
+    def complete(self, url, filename, validator=None, changed=False):
+        pass
+
+    def drop(self, url):
+        pass
+
+    # キューが空になった時点でクロールは終了する（他のワーカーを待つのは SharedFrontier のみ）
+    def wait_for_work(self):
+        return False
+
+    # キューに残っている (url, depth) を優先度順に列挙する
+    def pending(self):
+        for key in sorted(self.buckets):
+            yield from self.buckets[key].entries()
+
+    def clear(self):
+        for bucket in self.buckets.values():
+            bucket.clear()
+        self.buckets = {}
+        self.memory_count = 0
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+
+# クロールの進行状況を追記専用のJSONLファイルに記録する
+#
+# 1行が1件の操作を表す。
+#   {"op": "enqueue", "url": ..., "depth": ...}      : 未訪問URLの追加
+#   {"op": "visit", "url": ..., "file": ..., ...}     : ページの取得完了
+#   {"op": "drop", "url": ...}                        : 取得しなかったURL（robots.txtで不許可、エラー等）
+#   {"op": "validator", "url": ..., "validator": ...} : 前回クロール時の ETag 等（再クロール用）
+# replay() で progress.json と同じ形式の辞書に復元する。
+class CrawlJournal:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, op, **fields):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        fields['op'] = op
+        self.file.write(json.dumps(fields, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def replay(self):
+        visited = {}
+        pending = {}
+        validators = {}
+        changed = []
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中断時に書きかけになった最終行は読み飛ばす
+                    continue
+                op = record['op']
+                url = record['url']
+                if op == 'enqueue':
+                    if url not in visited:
+                        pending[url] = record.get('depth', 0)
+                elif op == 'visit':
+                    pending.pop(url, None)
+                    visited[url] = record['file']
+                    if record.get('validator'):
+                        validators[url] = record['validator']
+                    if record.get('changed'):
+                        changed.append(url)
+                elif op == 'drop':
+                    pending.pop(url, None)
+                elif op == 'validator':
+                    validators[url] = record['validator']
+        return {
+            'visited': visited,
+            'to_visit': list(pending),
+            'to_visit_depth': list(pending.values()),
+            'validators': validators,
+            'changed': changed
+        }
+
+    # progress.json 形式の状態から、最小限の操作だけを含むジャーナルを作り直す
+    def rewrite(self, progress_data):
+        self.close()
+        visited = progress_data.get('visited', {})
+        validators = progress_data.get('validators', {})
+        changed = set(progress_data.get('changed', []))
+        to_visit = progress_data.get('to_visit', [])
+        to_visit_depth = progress_data.get('to_visit_depth', [0] * len(to_visit))
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            for url, validator in validators.items():
+                if url not in visited:
+                    file.write(json.dumps({'op': 'validator', 'url': url, 'validator': validator}, ensure_ascii=False) + '\n')
+            for url, filename in visited.items():
+                record = {'op': 'visit', 'url': url, 'file': filename, 'validator': validators.get(url), 'changed': url in changed}
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            for url, depth in zip(to_visit, to_visit_depth):
+                file.write(json.dumps({'op': 'enqueue', 'url': url, 'depth': depth}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def compact(self):
+        self.rewrite(self.replay())
+
+    # 後続ステップ向けに progress.json 形式で書き出す
+    def export(self, progress_file):
+        with open(progress_file, 'w') as file:
+            json.dump(self.replay(), file, indent=2)
+
+# ジャーナルの圧縮・progress.json への書き出し
+#   python crawl_journal.py compact <journal_file>
+#   python crawl_journal.py export <journal_file> <progress_file>
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == 'compact':
+        CrawlJournal(sys.argv[2]).compact()
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'export':
+        CrawlJournal(sys.argv[2]).export(sys.argv[3])
+    else:
+        print("usage: crawl_journal.py compact <journal_file> | export <journal_file> <progress_file>")
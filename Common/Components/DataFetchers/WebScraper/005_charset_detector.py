@@ -0,0 +1,82 @@
+import re
+import codecs
+import chardet
+from urllib.parse import urlparse
+
+# ページの文字コードを判定する
+#
+# 以下の順に判定し、最初に妥当と確認できたものを採用する。
+#   1. 'bom'       : 先頭のBOM
+#   2. 'header'    : Content-Type ヘッダの charset
+#   3. 'meta'      : 先頭 sniff_bytes バイト内の <meta charset> / <meta http-equiv> / XML宣言
+#   4. 'host_cache': 同じホストで前回 chardet が判定した文字コード
+#   5. 'chardet'   : 先頭 detect_bytes バイトに対する chardet の判定
+# 2〜4 は先頭 detect_bytes バイトをその文字コードで復号できるか確認してから採用する。
+class CharsetDetector:
+    BOMS = [
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16'),
+    ]
+    HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+    META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+    XML_ENCODING = re.compile(rb'<\?xml[^>]+encoding\s*=\s*["\']([\w.:-]+)', re.IGNORECASE)
+    # Shift_JIS を名乗るページも機種依存文字（①、髙など）を含むことが多いため、上位互換の cp932 で復号する
+    ALIASES = {
+        'shift_jis': 'cp932',
+        'windows-31j': 'cp932',
+    }
+    # どんなバイト列でも復号できてしまう文字コード。先頭部分がASCIIのみの場合に限り採用する
+    SINGLE_BYTE = {'iso8859-1', 'cp1252'}
+
+    def __init__(self, sniff_bytes=4096, detect_bytes=32768):
+        self.sniff_bytes = sniff_bytes
+        self.detect_bytes = detect_bytes
+        self.host_cache = {}
+
+    def normalize(self, name):
+        if isinstance(name, bytes):
+            name = name.decode('ascii', errors='ignore')
+        try:
+            encoding = codecs.lookup(name).name
+        except LookupError:
+            return None
+        return self.ALIASES.get(encoding, encoding)
+
+    # 先頭部分を strict に復号できるか確認する（末尾で途切れたマルチバイト文字は許容）
+    def can_decode(self, content, encoding):
+        if encoding in self.SINGLE_BYTE:
+            return content[:self.detect_bytes].isascii()
+        try:
+            codecs.getincrementaldecoder(encoding)(errors='strict').decode(content[:self.detect_bytes], final=False)
+            return True
+        except (UnicodeDecodeError, LookupError):
+            return False
+
+    def candidates(self, url, content, content_type):
+        match = self.HEADER_CHARSET.search(content_type or '')
+        if match:
+            yield match.group(1), 'header'
+        head = content[:self.sniff_bytes]
+        match = self.META_CHARSET.search(head) or self.XML_ENCODING.search(head)
+        if match:
+            yield match.group(1), 'meta'
+        cached = self.host_cache.get(urlparse(url).netloc)
+        if cached:
+            yield cached, 'host_cache'
+
+    # (文字コード, 判定方法) を返す
+    def detect(self, url, content, content_type=''):
+        for bom, encoding in self.BOMS:
+            if content.startswith(bom):
+                return encoding, 'bom'
+        for name, method in self.candidates(url, content, content_type):
+            encoding = self.normalize(name)
+            if encoding and self.can_decode(content, encoding):
+                return encoding, method
+        detected = chardet.detect(content[:self.detect_bytes])['encoding']
+        encoding = self.normalize(detected) if detected else None
+        if encoding:
+            self.host_cache[urlparse(url).netloc] = encoding
+            return encoding, 'chardet'
+        return 'utf-8', 'default'
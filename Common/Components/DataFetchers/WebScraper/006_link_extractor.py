@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+
+# selectolax / lxml はインストールされている場合のみ使用する
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+# 保存済みページの読み出し（ベンチマーク用。CLI として直接実行した場合は同じディレクトリから読み込む）
+try:
+    from lib.page_store import page_extension, read_page
+except ImportError:
+    from page_store import page_extension, read_page
+
+# ページ内の <a href> を取り出し、絶対URLに変換して同じホストのものだけを返す
+#
+# href の取り出し方（iter_hrefs）だけをパーサーごとに実装し、urljoin とホストの判定は共通にする。
+class LinkExtractor(ABC):
+    name = None
+
+    # html の全ての <a> の href を文書内の順に返す
+    @abstractmethod
+    def iter_hrefs(self, html):
+        pass
+
+    def extract_links(self, url, html, netloc):
+        links = []
+        for href in self.iter_hrefs(html):
+            absolute_link = urljoin(url, href)
+            if urlparse(absolute_link).netloc == netloc:
+                links.append(absolute_link)
+        return links
+
+# 従来の処理（BeautifulSoup + html.parser）
+class BeautifulSoupLinkExtractor(LinkExtractor):
+    name = 'bs4'
+
+    def iter_hrefs(self, html):
+        soup = BeautifulSoup(html, 'html.parser')
+        for link in soup.find_all('a', href=True):
+            yield link['href']
+
+class LxmlLinkExtractor(LinkExtractor):
+    name = 'lxml'
+
+    def iter_hrefs(self, html):
+        if not html.strip():
+            return
+        # 文字コードは判定済みのため、<meta charset> を無視するよう UTF-8 のバイト列で渡す
+        # （パーサーはスレッド間で共有できないため呼び出しごとに作成する）
+        root = etree.fromstring(html.encode('utf-8', errors='replace'), etree.HTMLParser(encoding='utf-8'))
+        if root is None:
+            return
+        for link in root.iter('a'):
+            href = link.get('href')
+            if href is not None:
+                yield href
+
+class SelectolaxLinkExtractor(LinkExtractor):
+    name = 'selectolax'
+
+    def iter_hrefs(self, html):
+        for link in LexborHTMLParser(html).css('a[href]'):
+            href = link.attributes.get('href')
+            yield href if href is not None else ''
+
+EXTRACTORS = {
+    'selectolax': (SelectolaxLinkExtractor, lambda: LexborHTMLParser is not None),
+    'lxml': (LxmlLinkExtractor, lambda: etree is not None),
+    'bs4': (BeautifulSoupLinkExtractor, lambda: True),
+}
+
+def available_extractors():
+    return [name for name, (_, available) in EXTRACTORS.items() if available()]
+
+# 'auto' の場合は selectolax → lxml → bs4 の順に、インストールされているものを使う
+def create_link_extractor(name='auto'):
+    if name == 'auto':
+        name = available_extractors()[0]
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown link extractor: {name}")
+    extractor_class, available = EXTRACTORS[name]
+    if not available():
+        raise ValueError(f"Link extractor '{name}' is not installed")
+    return extractor_class()
+
+# 保存済みのページでリンク抽出の速度と結果を bs4 と比較する
+#   python link_extractor.py <progress_file>
+def benchmark(progress_file):
+    with open(progress_file, 'r') as file:
+        visited = json.load(file).get('visited', {})
+    pages = []
+    for url, filepath in visited.items():
+        if page_extension(filepath) == '.html' and os.path.exists(filepath):
+            pages.append((url, read_page(filepath)))
+    print(f"{len(pages)} pages")
+    expected = None
+    baseline = None
+    for name in ['bs4'] + [name for name in available_extractors() if name != 'bs4']:
+        extractor = create_link_extractor(name)
+        start = time.perf_counter()
+        links = [extractor.extract_links(url, html, urlparse(url).netloc) for url, html in pages]
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            expected, baseline = links, elapsed
+        mismatches = sum(1 for a, b in zip(expected, links) if a != b)
+        print(f"{name:>10}: {elapsed:.3f} s ({elapsed / max(len(pages), 1) * 1000:.2f} ms/page), "
+              f"x{baseline / elapsed:.1f} vs bs4, {mismatches} pages with different links")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark(sys.argv[1])
+    else:
+        print("usage: link_extractor.py <progress_file>")
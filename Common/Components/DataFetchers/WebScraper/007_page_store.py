@@ -0,0 +1,242 @@
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+
+# zstandard はインストールされている場合のみ使用する（無い場合は gzip で圧縮する）
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# 索引への追記を他のプロセスと排他する（fcntl が無い環境ではプロセス内の排他のみ）
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 取得したページを内容のハッシュ(sha256)をキーとして圧縮保存する
+#
+#   {root}/objects/{sha256[:2]}/{sha256}{拡張子}.zst : ページ本体（gzip の場合は .gz）
+#   {root}/index.jsonl                               : URL → 内容の対応（1行1件、後の行が優先）
+# 異なるURL（クエリ文字列違い、index.html と / など）から同じ内容を取得した場合は1回だけ保存する。
+# progress.json の visited にはオブジェクトのパスが入るため、読み出しは read_page / PageReader を使う。
+# 複数のプロセス（shared_frontier のワーカー）で同じ場所に保存できるよう、一時ファイルは mkstemp で作成し、
+# 索引は flush のたびにファイルをロックしてまとめて追記する。
+class PageStore:
+    SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+    # 索引に書き出さずに保持する行数の上限
+    INDEX_BUFFER = 1000
+
+    def __init__(self, root, compression='auto', level=3):
+        if compression == 'auto':
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression not in self.SUFFIXES:
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstandard is not installed")
+        self.root = root
+        self.compression = compression
+        self.level = level
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.index_file = None
+        self.index_lines = []
+        self.lock = threading.Lock()
+        self.stats = {'pages': 0, 'stored': 0, 'deduplicated': 0, 'bytes': 0, 'stored_bytes': 0}
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+    def object_path(self, digest, extension):
+        return os.path.join(self.root, 'objects', digest[:2], f"{digest}{extension}{self.SUFFIXES[self.compression]}")
+
+    def compress(self, data):
+        if self.compression == 'zstd':
+            # ZstdCompressor はスレッド間で共有できないため呼び出しごとに作成する
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return gzip.compress(data, mtime=0)
+
+    def compress_writer(self, file):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level).stream_writer(file, closefd=False)
+        return gzip.GzipFile(fileobj=file, mode='wb', mtime=0)
+
+    # ページの内容を保存し、オブジェクトのパスを返す
+    def put(self, url, data, extension):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest, extension)
+        stored_bytes = 0
+        if not os.path.exists(path):
+            compressed = self.compress(data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(compressed)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            stored_bytes = len(compressed)
+        self.add_to_index(url, digest, path, len(data), stored_bytes)
+        return path
+
+    # チャンク単位で圧縮しながら一時ファイルに書き出し、内容のハッシュが確定してから移動する
+    # （PDF などの大きなファイルをメモリに読み込まずに保存する）
+    def put_stream(self, url, chunks, extension):
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(prefix='stream.', suffix='.tmp', dir=os.path.join(self.root, 'objects'))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                with self.compress_writer(file) as writer:
+                    for chunk in chunks:
+                        sha256.update(chunk)
+                        size += len(chunk)
+                        writer.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        digest = sha256.hexdigest()
+        path = self.object_path(digest, extension)
+        stored_bytes = 0
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            stored_bytes = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        self.add_to_index(url, digest, path, size, stored_bytes)
+        return path
+
+    def add_to_index(self, url, digest, path, size, stored_bytes):
+        with self.lock:
+            self.stats['pages'] += 1
+            self.stats['bytes'] += size
+            if stored_bytes:
+                self.stats['stored'] += 1
+                self.stats['stored_bytes'] += stored_bytes
+            else:
+                self.stats['deduplicated'] += 1
+            self.index_lines.append(json.dumps({'url': url, 'sha256': digest, 'file': path, 'size': size}, ensure_ascii=False) + '\n')
+            if len(self.index_lines) >= self.INDEX_BUFFER:
+                self.write_index()
+
+    # 保持している行を索引に追記する（self.lock を確保して呼ぶ）
+    # 他のプロセスの追記と行が混ざらないよう、ファイルをロックしてから1回で書き込む
+    def write_index(self):
+        if not self.index_lines:
+            return
+        if self.index_file is None:
+            self.index_file = open(self.index_path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(self.index_file.fileno(), fcntl.LOCK_EX)
+        try:
+            self.index_file.write(''.join(self.index_lines))
+            self.index_file.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.index_file.fileno(), fcntl.LOCK_UN)
+        self.index_lines = []
+
+    # URL → オブジェクトのパス（保持している行を書き出してから読み込む）
+    def load_index(self):
+        self.flush()
+        index = {}
+        if not os.path.exists(self.index_path):
+            return index
+        with open(self.index_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                index[record['url']] = record['file']
+        return index
+
+    def flush(self):
+        with self.lock:
+            self.write_index()
+
+    def close(self):
+        with self.lock:
+            self.write_index()
+            if self.index_file is not None:
+                self.index_file.close()
+                self.index_file = None
+
+    def print_summary(self):
+        stats = self.stats
+        if stats['pages'] == 0:
+            return
+        print(f"Page store ({self.compression}): {stats['pages']} pages, {stats['stored']} stored, "
+              f"{stats['deduplicated']} deduplicated, {stats['bytes']} -> {stats['stored_bytes']} bytes")
+
+# PageStore のオブジェクトのファイル名（{sha256}{拡張子}.zst / .gz）
+STORE_OBJECT = re.compile(r'^[0-9a-f]{64}(\.[^.]+)?\.(zst|gz)$')
+
+# 保存済みページの拡張子（PageStore のオブジェクトは圧縮形式の拡張子を除く）
+def page_extension(path):
+    match = STORE_OBJECT.match(os.path.basename(path))
+    if match:
+        return match.group(1) or ''
+    return os.path.splitext(path)[1]
+
+# 保存済みページをバイナリの読み込み用に開く（従来のファイル単位の保存・PageStore のどちらにも対応）
+# PageStore のオブジェクトは読み込みながら展開するため、大きなファイルも少しずつ読める
+def open_page(path):
+    match = STORE_OBJECT.match(os.path.basename(path))
+    if not match:
+        return open(path, 'rb')
+    if match.group(2) == 'gz':
+        return gzip.open(path, 'rb')
+    if zstandard is None:
+        raise ValueError(f"zstandard is not installed: {path}")
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+# 保存済みページをバイト列で読み出す
+def read_page_bytes(path):
+    with open_page(path) as file:
+        return file.read()
+
+# 保存済みページを文字列で読み出す（スクレイピング時に UTF-8 で保存している）
+def read_page(path, encoding='utf-8'):
+    return read_page_bytes(path).decode(encoding)
+
+# progress.json の visited からページを読み出す
+class PageReader:
+    def __init__(self, progress_file):
+        with open(progress_file, 'r') as file:
+            self.visited = json.load(file).get('visited', {})
+
+    def urls(self):
+        return list(self.visited)
+
+    def extension(self, url):
+        return page_extension(self.visited[url])
+
+    def open(self, url):
+        return open_page(self.visited[url])
+
+    def read_bytes(self, url):
+        return read_page_bytes(self.visited[url])
+
+    def read_text(self, url, encoding='utf-8'):
+        return read_page(self.visited[url], encoding)
+
+    # 指定した拡張子のページを (URL, 内容) で順に返す
+    def iter_pages(self, extensions=('.html',)):
+        for url, path in self.visited.items():
+            if page_extension(path) in extensions and os.path.exists(path):
+                yield url, read_page(path)
+
+# 保存済みページの内容を表示する
+#   python page_store.py <progress_file> <url>
+if __name__ == "__main__":
+    if len(sys.argv) >= 3:
+        print(PageReader(sys.argv[1]).read_text(sys.argv[2]))
+    else:
+        print("usage: page_store.py <progress_file> <url>")
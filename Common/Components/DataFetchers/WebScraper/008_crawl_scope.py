@@ -0,0 +1,108 @@
+import re
+import gzip
+import threading
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+# クロール対象とするURLの範囲
+#
+# 以下の順に判定し、最初に該当したルールで除外する。
+#   'exclude:<正規表現>' : exclude_patterns のいずれかにマッチする
+#   'include'            : include_patterns を指定していて、どれにもマッチしない
+#   'max_depth'          : 開始URLからの深さが max_depth を超える
+# ルールごとに除外したURL数（＝取得せずに済んだ件数）を skipped に数える。
+class CrawlScope:
+    def __init__(self, include_patterns=None, exclude_patterns=None, max_depth=None):
+        self.include_patterns = [re.compile(pattern) for pattern in (include_patterns or [])]
+        self.exclude_patterns = [re.compile(pattern) for pattern in (exclude_patterns or [])]
+        self.max_depth = max_depth
+        self.skipped = {}
+        self.rejected = set()
+        self.lock = threading.Lock()
+
+    def rule_for(self, url, depth):
+        for pattern in self.exclude_patterns:
+            if pattern.search(url):
+                return f"exclude:{pattern.pattern}"
+        if self.include_patterns and not any(pattern.search(url) for pattern in self.include_patterns):
+            return 'include'
+        if self.max_depth is not None and depth > self.max_depth:
+            return 'max_depth'
+        return None
+
+    # 範囲内のURLであれば True を返す。除外したURLは同じURLを二重に数えないよう記録する
+    def allows(self, url, depth):
+        rule = self.rule_for(url, depth)
+        if rule is None:
+            return True
+        with self.lock:
+            if url not in self.rejected:
+                self.rejected.add(url)
+                self.skipped[rule] = self.skipped.get(rule, 0) + 1
+        return False
+
+    def print_summary(self):
+        if self.skipped:
+            print(f"Skipped by scope: {sum(self.skipped.values())} URLs {self.skipped}")
+
+# sitemap.xml / サイトマップインデックスから URL を取得する
+#
+# サイトマップインデックスは再帰的にたどり、.xml.gz のサイトマップにも対応する。
+class SitemapReader:
+    # たどるサイトマップ数の上限（インデックスの循環・巨大なサイトへの対策）
+    MAX_SITEMAPS = 100
+
+    def __init__(self, http):
+        self.http = http
+        self.fetched = 0
+
+    @staticmethod
+    def local_name(tag):
+        return tag.rsplit('}', 1)[-1]
+
+    def parse(self, content):
+        # Content-Encoding ではなくファイル自体が gzip の場合（sitemap.xml.gz）
+        if content[:2] == b'\x1f\x8b':
+            content = gzip.decompress(content)
+        root = ET.fromstring(content)
+        locs = []
+        for child in root:
+            for element in child:
+                if self.local_name(element.tag) == 'loc' and element.text:
+                    locs.append(element.text.strip())
+        return self.local_name(root.tag), locs
+
+    # サイトマップに記載された URL を記載順に返す
+    def read(self, sitemap_urls):
+        urls = []
+        queue = list(sitemap_urls)
+        seen = set()
+        while queue and self.fetched < self.MAX_SITEMAPS:
+            sitemap_url = queue.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                response = self.http.get(sitemap_url)
+                if response.status_code != 200:
+                    print(f"Failed to fetch sitemap ({sitemap_url}): {response.status_code}")
+                    continue
+                kind, locs = self.parse(response.content)
+            except Exception as e:
+                print(f"Failed to read sitemap ({sitemap_url}): {e}")
+                continue
+            self.fetched += 1
+            if kind == 'sitemapindex':
+                queue.extend(locs)
+            else:
+                urls.extend(locs)
+        return urls
+
+    # robots.txt の Sitemap: 行、無ければ /sitemap.xml を使う
+    @staticmethod
+    def default_sitemaps(start_url, robots_parser):
+        sitemaps = robots_parser.site_maps() if robots_parser is not None else None
+        if sitemaps:
+            return sitemaps
+        parsed = urlparse(start_url)
+        return [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
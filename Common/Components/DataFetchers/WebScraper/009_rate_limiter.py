@@ -0,0 +1,136 @@
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# ホストごとのトークンバケット
+class HostBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # Retry-After で指定された再開時刻
+        self.blocked_until = 0
+        self.latency = None
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.waited = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+# 応答時間と 429/503 に応じてホストごとのリクエストレートを調整するレート制限
+#
+# ホストごとに rate (リクエスト/秒) のトークンバケットを持ち、リクエスト前に reserve() で
+# 待ち時間を得る。応答ごとに record() を呼ぶと以下のようにレートを変える。
+#   429/503 : レートを半分にし、Retry-After があればその時刻まで送らない
+#   通信エラー: レートを半分にする
+#   応答時間(指数移動平均)が latency_target 超 : レートを 0.8 倍にする
+#   それ以外: レートを increase だけ上げる（max_rate まで）
+class AdaptiveRateLimiter:
+    # 応答時間の指数移動平均の重み
+    LATENCY_WEIGHT = 0.2
+
+    def __init__(self, initial_rate=1.0, min_rate=0.1, max_rate=5.0, burst=1, latency_target=2.0, increase=0.1):
+        self.initial_rate = min(max(initial_rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.latency_target = latency_target
+        self.increase = increase
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host):
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = HostBucket(self.initial_rate, self.burst)
+            self.buckets[host] = bucket
+        return bucket
+
+    # トークンを1つ予約し、リクエストを送るまでに待つ秒数を返す
+    def reserve(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.get_bucket(host)
+            now = time.monotonic()
+            bucket.refill(now)
+            bucket.tokens -= 1
+            wait = max(0.0, -bucket.tokens / bucket.rate, bucket.blocked_until - now)
+            bucket.requests += 1
+            bucket.waited += wait
+        return wait
+
+    # 逐次クロール用: トークンを得るまで待つ
+    def acquire(self, url):
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    @staticmethod
+    def parse_retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def set_rate(self, host, bucket, rate, reason):
+        rate = min(max(rate, self.min_rate), self.max_rate)
+        # 減速した場合のみログに出す（加速は応答ごとに起きるため summary() で確認する）
+        if rate < bucket.rate:
+            print(f"\nRate limit: {host} {bucket.rate:.2f} -> {rate:.2f} req/s ({reason})")
+        bucket.rate = rate
+
+    # 応答の結果を記録してレートを調整する（status が None の場合は通信エラー）
+    def record(self, url, status, latency, retry_after=None):
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.get_bucket(host)
+            now = time.monotonic()
+            bucket.refill(now)
+            if status is None:
+                bucket.errors += 1
+                self.set_rate(host, bucket, bucket.rate * 0.5, 'error')
+                return
+            if bucket.latency is None:
+                bucket.latency = latency
+            else:
+                bucket.latency += self.LATENCY_WEIGHT * (latency - bucket.latency)
+            if status in (429, 503):
+                bucket.throttled += 1
+                delay = self.parse_retry_after(retry_after)
+                if delay:
+                    bucket.blocked_until = max(bucket.blocked_until, now + delay)
+                self.set_rate(host, bucket, bucket.rate * 0.5, f"{status}, retry after {delay or 0:.0f} s")
+            elif bucket.latency > self.latency_target:
+                self.set_rate(host, bucket, bucket.rate * 0.8, f"latency {bucket.latency:.2f} s")
+            else:
+                self.set_rate(host, bucket, bucket.rate + self.increase, 'ok')
+
+    # ホストごとの現在のレートと集計
+    def summary(self):
+        with self.lock:
+            return {host: {
+                'rate': bucket.rate,
+                'latency': bucket.latency,
+                'requests': bucket.requests,
+                'throttled': bucket.throttled,
+                'errors': bucket.errors,
+                'waited': bucket.waited
+            } for host, bucket in self.buckets.items()}
+
+    def print_summary(self):
+        for host, stats in self.summary().items():
+            latency = f"{stats['latency']:.2f} s" if stats['latency'] is not None else '-'
+            print(f"Rate limit: {host} {stats['rate']:.2f} req/s, latency {latency}, "
+                  f"{stats['requests']} requests, {stats['throttled']} throttled, {stats['errors']} errors, "
+                  f"waited {stats['waited']:.1f} s")
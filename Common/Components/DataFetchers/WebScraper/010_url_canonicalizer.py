@@ -0,0 +1,102 @@
+import threading
+from fnmatch import fnmatch
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# URLを正規化し、同じページを指すURLを1つにまとめる
+#
+# 以下のルールを順に適用する（ルール名は集計に使う）。
+# 既定では取得するURLの意味を変えないルール（host・fragment）だけを適用する。
+# strip_params / query / index / trailing_slash はサーバーによっては別のページになるため、指定した場合のみ適用する。
+#   'host'          : scheme / ホスト名を小文字にし、既定のポート(:80, :443)を除く
+#   'fragment'      : #以降を除く（drop_fragment）
+#   'strip_params'  : strip_params (fnmatch 形式) にマッチするクエリパラメータを除く
+#   'query'         : query='sort' ならパラメータを名前順に並べ替え、'strip' ならクエリ全体を除く
+#   'index'         : 末尾が index_documents のファイル名であれば除く（/a/index.html -> /a/）
+#   'trailing_slash': 'add' なら拡張子の無いパスの末尾に / を付け、'remove' なら末尾の / を除く
+class UrlCanonicalizer:
+    DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+    def __init__(self, drop_fragment=True, query='keep', strip_params=None, index_documents=None, trailing_slash='keep'):
+        if query not in ('keep', 'sort', 'strip'):
+            raise ValueError(f"Unknown query rule: {query}")
+        if trailing_slash not in ('keep', 'add', 'remove'):
+            raise ValueError(f"Unknown trailing slash rule: {trailing_slash}")
+        self.drop_fragment = drop_fragment
+        self.query = query
+        self.strip_params = strip_params or []
+        self.index_documents = index_documents or []
+        self.trailing_slash = trailing_slash
+        # 正規化前のURL・正規化後のURLの種類数（差が取得せずに済んだ件数）
+        self.raw_urls = set()
+        self.canonical_urls = set()
+        self.rewritten = {}
+        self.lock = threading.Lock()
+
+    def apply_rules(self, url):
+        applied = []
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc.lower()
+        if parts.port is not None and self.DEFAULT_PORTS.get(scheme) == parts.port:
+            netloc = netloc.rsplit(':', 1)[0]
+        if (scheme, netloc) != (parts.scheme, parts.netloc):
+            applied.append('host')
+        fragment = parts.fragment
+        if self.drop_fragment and (fragment or url.endswith('#')):
+            fragment = ''
+            applied.append('fragment')
+        query = parts.query
+        if query:
+            params = parse_qsl(query, keep_blank_values=True)
+            kept = [(name, value) for name, value in params if not any(fnmatch(name, pattern) for pattern in self.strip_params)]
+            if len(kept) != len(params):
+                applied.append('strip_params')
+            if self.query == 'strip':
+                kept = []
+            elif self.query == 'sort':
+                kept = sorted(kept, key=lambda param: param[0])
+            if self.query != 'keep' and kept != params:
+                applied.append('query')
+            if kept != params:
+                query = urlencode(kept)
+        path = parts.path or '/'
+        directory, _, name = path.rpartition('/')
+        if name in self.index_documents:
+            path = f"{directory}/"
+            applied.append('index')
+        elif self.trailing_slash == 'add' and name and '.' not in name:
+            path = f"{path}/"
+            applied.append('trailing_slash')
+        elif self.trailing_slash == 'remove' and path != '/' and path.endswith('/'):
+            path = path.rstrip('/') or '/'
+            applied.append('trailing_slash')
+        return urlunsplit((scheme, netloc, path, query, fragment)), applied
+
+    # 正規化したURLを返し、取得せずに済んだURLを集計する
+    def canonicalize(self, url):
+        canonical, applied = self.apply_rules(url)
+        with self.lock:
+            if url not in self.raw_urls:
+                self.raw_urls.add(url)
+                self.canonical_urls.add(canonical)
+                for rule in applied:
+                    self.rewritten[rule] = self.rewritten.get(rule, 0) + 1
+        return canonical
+
+    # 前回までに訪問済みのURLを登録し、正規化したURLを返す（集計には含めない）
+    def register(self, url):
+        canonical, _ = self.apply_rules(url)
+        with self.lock:
+            self.raw_urls.add(url)
+            self.canonical_urls.add(canonical)
+        return canonical
+
+    # 重複として取得しなかったURL数
+    def avoided(self):
+        with self.lock:
+            return len(self.raw_urls) - len(self.canonical_urls)
+
+    def print_summary(self):
+        avoided = self.avoided()
+        if avoided or self.rewritten:
+            print(f"Canonicalized URLs: {avoided} duplicate fetches avoided, rewritten by rule {self.rewritten}")
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+from lib.http_client import HttpClient
+from lib.crawl_metrics import CrawlMetrics
+from web_scraper_step import WebScraperStep, HostLimiter
+
+# 複数の自治体のホームページを同時にクロールする
+#
+# sites に並べたサイトごとに WebScraperStep を作成し、スレッドプール（大きさが全体の同時リクエスト数 concurrency）・
+# HTTPクライアント・ホストごとのレート制限・計測値（metrics_file / metrics_port）を共有して並行にクロールする。
+# 全体の所要時間は各サイトの所要時間の合計ではなく、最も時間のかかるサイトで決まる。
+# sites の各要素に無いパラメータ（user_agent, save_every など）はステップ自体の設定を使う。
+class MultiSiteScraperStep:
+    # サイトごとの設定には引き継がないキー
+    STEP_KEYS = ('name', 'type', 'sites', 'skip_flg')
+
+    def __init__(self, step_config):
+        self.concurrency = int(step_config.get('concurrency', 8))
+        self.per_host_concurrency = int(step_config.get('per_host_concurrency', 2))
+        self.timing_file = step_config.get('timing_file')
+        common = {key: value for key, value in step_config.items() if key not in self.STEP_KEYS}
+        self.site_configs = [{**common, **site} for site in step_config['sites']]
+        self.http = HttpClient(
+            step_config.get('user_agent'),
+            pool_connections=int(step_config.get('pool_connections', max(len(self.site_configs), 10))),
+            pool_maxsize=int(step_config.get('pool_maxsize', max(self.per_host_concurrency, 10))),
+            timeout=float(step_config.get('http_timeout', 30)),
+            max_timings=int(step_config.get('http_max_timings', 10000)))
+        self.rate_limiter = WebScraperStep.create_rate_limiter(step_config)
+        self.metrics = CrawlMetrics()
+        self.metrics.add_rate_limiter(self.rate_limiter)
+        self.metrics_file = step_config.get('metrics_file')
+        self.metrics_port = step_config.get('metrics_port')
+        self.metrics_interval = float(step_config.get('metrics_interval', 10))
+        self.scrapers = []
+        for site_config in self.site_configs:
+            # サイトごとの同時処理数の既定値は全体の concurrency（全体の同時リクエスト数は共有のスレッドプールの大きさで決まる）
+            site_config.setdefault('concurrency', self.concurrency)
+            self.scrapers.append(WebScraperStep(
+                site_config, http=self.http, rate_limiter=self.rate_limiter,
+                download_dir=site_config.get('output_dir'), metrics=self.metrics))
+        self.elapsed = {}
+
+    async def crawl_site(self, scraper, executor, limiter):
+        start = time.perf_counter()
+        try:
+            await scraper.crawl_async(executor, limiter)
+        finally:
+            self.elapsed[scraper.start_url] = time.perf_counter() - start
+            scraper.finish_crawl()
+
+    async def crawl_all(self):
+        limiter = HostLimiter(self.per_host_concurrency, self.rate_limiter)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = await asyncio.gather(
+                *[self.crawl_site(scraper, executor, limiter) for scraper in self.scrapers],
+                return_exceptions=True)
+        for scraper, result in zip(self.scrapers, results):
+            if isinstance(result, Exception):
+                print(f"Error crawling {scraper.start_url}: {result}")
+
+    def execute(self):
+        start = time.perf_counter()
+        self.metrics.export(self.metrics_file, self.metrics_port, self.metrics_interval)
+        try:
+            asyncio.run(self.crawl_all())
+        finally:
+            self.metrics.close()
+        total = time.perf_counter() - start
+        print(f"\nMulti-site crawl completed in {total:.1f} s "
+              f"(sum of sites {sum(self.elapsed.values()):.1f} s)")
+        for url, elapsed in self.elapsed.items():
+            print(f"  {url}: {elapsed:.1f} s")
+        self.rate_limiter.print_summary()
+        self.http.print_summary()
+        if self.timing_file:
+            self.http.write_timings(self.timing_file)
@@ -0,0 +1,308 @@
+import os
+import re
+import sys
+import gzip
+import uuid
+import base64
+import hashlib
+import itertools
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# 取得したページを WARC (gzip圧縮, 1レコードごとに独立した gzip メンバー) に保存する
+#
+# ページごとに request / response レコードを続けて書き込み（request レコードの WARC-Concurrent-To は response レコードの ID）、
+# response レコードの位置を CDX 形式の索引に追記する。
+#   CDX の列: <SURT形式のURL> <取得時刻(14桁)> <URL> <MIMEタイプ> <ステータス> <sha1> - - <圧縮後の長さ> <オフセット> <WARCファイル>
+#   WARCファイルは CDX のディレクトリからの相対パス（同じディレクトリであればファイル名）
+# 保存済みファイルの本文（バイナリの応答）は chunk_size バイトずつ読み出して gzip メンバーに書き込むため、メモリに全体を読み込まない。
+# WarcArchive で索引から該当レコードだけを読み出せるため、再処理にネットワークは不要。
+# requests は Content-Encoding (gzip, br など) を展開済みのため、本文は展開後のものを保存し、
+# Content-Encoding / Transfer-Encoding ヘッダは除いて Content-Length を付け直す。
+class WarcWriter:
+    # 本文を書き換えたため保存しない HTTP ヘッダ
+    DROP_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+    CDX_HEADER = ' CDX N b a m s k r M S V g\n'
+
+    def __init__(self, path, cdx_path=None, software='web_scraper_step', chunk_size=64 * 1024):
+        self.path = path
+        self.cdx_path = cdx_path or default_cdx_path(path)
+        self.warc_name = relative_warc_path(path, self.cdx_path)
+        self.chunk_size = chunk_size
+        # request / response レコードと CDX の行を1つの単位で書き込むため、write_exchange の中から write_record を呼べるようにする
+        self.lock = threading.RLock()
+        self.file = open(self.path, 'ab')
+        new_cdx = not os.path.exists(self.cdx_path)
+        self.cdx_file = open(self.cdx_path, 'a', encoding='utf-8')
+        if new_cdx:
+            self.cdx_file.write(self.CDX_HEADER)
+        self.records = 0
+        self.write_record('warcinfo', None, f"software: {software}\r\nformat: WARC File Format 1.1\r\n".encode('utf-8'),
+                          {'Content-Type': 'application/warc-fields'})
+
+    @staticmethod
+    def warc_date(fetched_at):
+        return fetched_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    @staticmethod
+    def record_id():
+        return f"<urn:uuid:{uuid.uuid4()}>"
+
+    # 1レコードを gzip メンバーとして書き込み、(オフセット, 圧縮後の長さ) を返す
+    # payload はバイト列、またはバイト列のチャンクを返すイテラブル（その場合は length に合計の長さを渡す）
+    def write_record(self, record_type, url, payload, headers, fetched_at=None, length=None, record_id=None):
+        fetched_at = fetched_at or datetime.now(timezone.utc)
+        if isinstance(payload, bytes):
+            length = len(payload)
+            payload = [payload]
+        lines = [
+            'WARC/1.1',
+            f"WARC-Type: {record_type}",
+            f"WARC-Record-ID: {record_id or self.record_id()}",
+            f"WARC-Date: {self.warc_date(fetched_at)}",
+        ]
+        if url:
+            lines.append(f"WARC-Target-URI: {url}")
+        for name, value in headers.items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {length}")
+        with self.lock:
+            offset = self.file.tell()
+            with gzip.GzipFile(filename='', mode='wb', fileobj=self.file, mtime=0) as member:
+                member.write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+                for chunk in payload:
+                    member.write(chunk)
+                member.write(b'\r\n\r\n')
+            self.records += 1
+            return offset, self.file.tell() - offset
+
+    @staticmethod
+    def payload_digest(body):
+        return base64.b32encode(hashlib.sha1(body).digest()).decode('ascii')
+
+    # 保存済みファイルを chunk_size バイトずつ読み出す
+    def file_chunks(self, path, opener):
+        with opener(path) as file:
+            for chunk in iter(lambda: file.read(self.chunk_size), b''):
+                yield chunk
+
+    # 保存済みファイルの (sha1, 長さ)
+    def file_digest(self, path, opener):
+        sha1 = hashlib.sha1()
+        length = 0
+        for chunk in self.file_chunks(path, opener):
+            sha1.update(chunk)
+            length += len(chunk)
+        return base64.b32encode(sha1.digest()).decode('ascii'), length
+
+    def http_request_block(self, response):
+        request = response.request
+        lines = [f"{request.method} {request.path_url} HTTP/1.1", f"Host: {urlsplit(request.url).netloc}"]
+        lines += [f"{name}: {value}" for name, value in request.headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+
+    def http_response_head(self, response, length):
+        lines = [f"HTTP/1.1 {response.status_code} {response.reason or ''}".rstrip()]
+        lines += [f"{name}: {value}" for name, value in response.headers.items() if name.lower() not in self.DROP_HEADERS]
+        lines.append(f"Content-Length: {length}")
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', errors='replace')
+
+    # ページの request / response レコードを書き込み、CDX 索引に追記する
+    # body は本文のバイト列、または保存済みファイルのパス（opener で開いてチャンク単位で読み出す）
+    # charset にはスクレイピング時に判定した文字コードを渡す（WarcArchive.read_text で使用）
+    def write_exchange(self, url, response, body, fetched_at, charset=None, opener=None):
+        if isinstance(body, bytes):
+            digest = self.payload_digest(body)
+            body_length = len(body)
+            chunks = [body]
+        else:
+            opener = opener or open_binary
+            digest, body_length = self.file_digest(body, opener)
+            chunks = self.file_chunks(body, opener)
+        http_head = self.http_response_head(response, body_length)
+        response_id = self.record_id()
+        request_headers = {
+            'Content-Type': 'application/http; msgtype=request',
+            'WARC-Concurrent-To': response_id,
+        }
+        response_headers = {
+            'Content-Type': 'application/http; msgtype=response',
+            'WARC-Payload-Digest': f"sha1:{digest}",
+        }
+        if charset:
+            response_headers['WARC-X-Detected-Charset'] = charset
+        mime = (response.headers.get('Content-Type') or 'unk').split(';')[0].strip() or 'unk'
+        redirect = response.headers.get('Location', '-') if 300 <= response.status_code < 400 else '-'
+        with self.lock:
+            start = self.file.tell()
+            try:
+                self.write_record('request', url, self.http_request_block(response), request_headers, fetched_at)
+                offset, length = self.write_record('response', url, itertools.chain([http_head], chunks), response_headers,
+                                                   fetched_at, length=len(http_head) + body_length, record_id=response_id)
+            except BaseException:
+                # 保存済みファイルを読み出せなかった場合などは、途中まで書き込んだレコードを除く
+                self.file.flush()
+                self.file.truncate(start)
+                raise
+            cdx_line = ' '.join([
+                surt(url), fetched_at.strftime('%Y%m%d%H%M%S'), url, mime.replace(' ', ''), str(response.status_code),
+                digest, redirect.replace(' ', '%20'), '-', str(length), str(offset), self.warc_name
+            ])
+            self.cdx_file.write(cdx_line + '\n')
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            self.cdx_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.cdx_file.close()
+
+def open_binary(path):
+    return open(path, 'rb')
+
+def default_cdx_path(warc_path):
+    base = warc_path[:-len('.warc.gz')] if warc_path.endswith('.warc.gz') else os.path.splitext(warc_path)[0]
+    return f"{base}.cdx"
+
+# 複数のワーカーが同じ WARC / CDX に追記しないよう、ファイル名にワーカーIDを付ける
+#   ./crawl.warc.gz, host-123 -> ./crawl.host-123.warc.gz
+def worker_path(path, worker_id):
+    suffix = re.sub(r'[^\w.-]', '_', str(worker_id))
+    for ext in ('.warc.gz', '.warc'):
+        if path.endswith(ext):
+            return f"{path[:-len(ext)]}.{suffix}{ext}"
+    base, ext = os.path.splitext(path)
+    return f"{base}.{suffix}{ext}"
+
+# CDX に記録する WARC ファイルのパス（CDX のディレクトリからの相対パス。相対パスにできない場合は絶対パス）
+def relative_warc_path(warc_path, cdx_path):
+    try:
+        return os.path.relpath(os.path.abspath(warc_path), os.path.dirname(os.path.abspath(cdx_path)))
+    except ValueError:
+        return os.path.abspath(warc_path)
+
+# CDX の並べ替え・検索用のURL（ホスト名を逆順にし、www. と scheme を除く）
+#   https://www.city.arao.lg.jp/a/b.html?x=1 -> jp,lg,arao,city)/a/b.html?x=1
+def surt(url):
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    key = ','.join(reversed(host.split('.'))) + ')' + (parts.path or '/').lower()
+    if parts.query:
+        key += '?' + '&'.join(sorted(parts.query.split('&'))).lower()
+    return key
+
+# WARC から読み出した response レコード
+class WarcRecord:
+    HTTP_STATUS = re.compile(r'^HTTP/[\d.]+\s+(\d{3})')
+
+    def __init__(self, warc_headers, http_headers, status, body):
+        self.warc_headers = warc_headers
+        self.http_headers = http_headers
+        self.status = status
+        self.body = body
+
+    @property
+    def url(self):
+        return self.warc_headers.get('WARC-Target-URI')
+
+    @property
+    def date(self):
+        return self.warc_headers.get('WARC-Date')
+
+    @property
+    def content_type(self):
+        return self.http_headers.get('content-type', '')
+
+    @staticmethod
+    def parse_headers(block):
+        lines = block.split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip()] = value.strip()
+        return lines[0], headers
+
+    @classmethod
+    def parse(cls, data):
+        head, _, rest = data.partition(b'\r\n\r\n')
+        _, warc_headers = cls.parse_headers(head.decode('utf-8'))
+        block = rest[:int(warc_headers.get('Content-Length', len(rest)))]
+        http_head, _, body = block.partition(b'\r\n\r\n')
+        status_line, http_headers = cls.parse_headers(http_head.decode('latin-1'))
+        match = cls.HTTP_STATUS.match(status_line)
+        http_headers = {name.lower(): value for name, value in http_headers.items()}
+        return cls(warc_headers, http_headers, int(match.group(1)) if match else None, body)
+
+    # スクレイピング時に判定した文字コード → Content-Type の charset → UTF-8 の順に使って復号する
+    def text(self):
+        charset = self.warc_headers.get('WARC-X-Detected-Charset')
+        if not charset:
+            match = re.search(r'charset\s*=\s*["\']?([\w.:-]+)', self.content_type, re.IGNORECASE)
+            charset = match.group(1) if match else 'utf-8'
+        return self.body.decode(charset, errors='replace')
+
+# CDX 索引を使って WARC からURL単位でページを読み出す（ネットワークは使わない）
+# WARC ファイルは CDX に記録されたパスを CDX のディレクトリから解決する
+# 複数ワーカーでクロールした場合はワーカーごとの CDX をリストで渡す
+class WarcArchive:
+    def __init__(self, cdx_path):
+        self.cdx_paths = [cdx_path] if isinstance(cdx_path, str) else list(cdx_path)
+        # URL → (WARCファイルのパス, オフセット, 長さ, ステータス)。同じURLが複数ある場合は最後のものを使う
+        self.index = {}
+        for path in self.cdx_paths:
+            directory = os.path.dirname(path)
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.startswith(' CDX'):
+                        continue
+                    fields = line.split()
+                    if len(fields) < 11:
+                        continue
+                    self.index[fields[2]] = (os.path.join(directory, fields[10]), int(fields[9]), int(fields[8]), fields[4])
+
+    def urls(self):
+        return list(self.index)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def get(self, url):
+        path, offset, length, _ = self.index[url]
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            data = file.read(length)
+        return WarcRecord.parse(gzip.decompress(data))
+
+    def read_bytes(self, url):
+        return self.get(url).body
+
+    def read_text(self, url):
+        return self.get(url).text()
+
+    # ステータス 200 のページのうち Content-Type が mime_types のものを (URL, 内容) で返す
+    def iter_pages(self, mime_types=('text/html', 'application/xhtml+xml')):
+        for url in self.index:
+            record = self.get(url)
+            if record.status == 200 and record.content_type.split(';')[0].strip().lower() in mime_types:
+                yield url, record.text()
+
+# WARC に保存したページの一覧・内容を表示する
+#   python warc_archive.py <cdx_file>        : 保存されているURLの一覧（カンマ区切りで複数の CDX を指定できる）
+#   python warc_archive.py <cdx_file> <url>  : ページの内容
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        for url, (_, _, _, status) in WarcArchive(sys.argv[1].split(',')).index.items():
+            print(status, url)
+    elif len(sys.argv) >= 3:
+        print(WarcArchive(sys.argv[1].split(',')).read_text(sys.argv[2]))
+    else:
+        print("usage: warc_archive.py <cdx_file> [url]")
@@ -0,0 +1,202 @@
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+# クローラーの検証用にローカルで自治体サイトを再現するHTTPサーバー
+#
+# ページの内容は以下のいずれかから作る。
+#   SyntheticSite : ページ数・リンク数・ページの大きさ・文字コードを指定して生成したサイト
+#   RecordedSite  : warc_file で保存したクロール結果（CDX 索引）。HTML 内の元サイトへの絶対URLはローカルのURLに置き換える
+# latency / jitter (秒) で応答を遅らせ、error_rate の割合で 503 (Retry-After 付き) を返す。
+class SyntheticSite:
+    # 本文に使う文（自治体サイトらしい語を含める）
+    SENTENCES = [
+        '子育て支援の申請は窓口またはオンラインで受け付けています。',
+        '対象となる方は、市内に住所を有する方です。',
+        '補助金の支給には事前の登録が必要です。',
+        '施設の利用料金は以下の表のとおりです。',
+        '詳しくはお問い合わせください。',
+    ]
+
+    # pages 件のページを、各ページから fanout 件の子ページへの木構造で作り、さらに cross_links 件のランダムなリンクを加える
+    def __init__(self, pages=500, fanout=5, cross_links=3, page_bytes=8000, encoding='utf-8', seed=0):
+        self.pages = pages
+        self.encoding = encoding
+        rng = random.Random(seed)
+        self.bodies = {}
+        for index in range(pages):
+            children = [child for child in range(index * fanout + 1, index * fanout + fanout + 1) if child < pages]
+            links = children + [rng.randrange(pages) for _ in range(cross_links)]
+            self.bodies[self.path(index)] = self.render(index, links, page_bytes, rng)
+
+    @staticmethod
+    def path(index):
+        return '/' if index == 0 else f"/page/{index}.html"
+
+    def render(self, index, links, page_bytes, rng):
+        charset = 'Shift_JIS' if self.encoding in ('shift_jis', 'cp932') else self.encoding
+        head = f'<html><head><meta charset="{charset}"><title>ページ {index}</title></head><body>'
+        parts = [head, f'<div id="contents"><h1>ページ {index}</h1>']
+        # 見出しごとに本文を入れ、page_bytes 程度の大きさにする
+        size = len(head)
+        section = 0
+        while size < page_bytes:
+            section += 1
+            text = ''.join(rng.choice(self.SENTENCES) for _ in range(5))
+            block = f'<h2>項目 {section}</h2><p>{text}</p>'
+            parts.append(block)
+            size += len(block.encode('utf-8'))
+        parts.append('</div><ul>')
+        parts += [f'<li><a href="{self.path(link)}">ページ {link}</a></li>' for link in links]
+        parts.append('</ul></body></html>')
+        return ''.join(parts).encode(self.encoding, errors='replace')
+
+    def get(self, path, base_url):
+        body = self.bodies.get(path)
+        if body is None:
+            return 404, {'Content-Type': 'text/html'}, b'<html><body>Not Found</body></html>'
+        return 200, {'Content-Type': f"text/html; charset={self.encoding}"}, body
+
+class RecordedSite:
+    # 再生時に付け直す（保存した値を使わない）ヘッダ
+    SKIP_HEADERS = {'content-length', 'connection', 'keep-alive', 'transfer-encoding', 'content-encoding', 'date', 'server'}
+
+    def __init__(self, cdx_path):
+        # WARC の読み出しは lib/warc_archive.py を使う（CLI として直接実行した場合は同じディレクトリから読み込む）
+        try:
+            from lib.warc_archive import WarcArchive
+        except ImportError:
+            from warc_archive import WarcArchive
+        self.archive = WarcArchive(cdx_path)
+        self.paths = {}
+        self.origins = set()
+        for url in self.archive.urls():
+            parts = urlsplit(url)
+            self.paths[parts.path + (f"?{parts.query}" if parts.query else '')] = url
+            self.origins.add(f"{parts.scheme}://{parts.netloc}")
+
+    def get(self, path, base_url):
+        url = self.paths.get(path)
+        if url is None:
+            return 404, {'Content-Type': 'text/html'}, b'<html><body>Not Found</body></html>'
+        record = self.archive.get(url)
+        headers = {name: value for name, value in record.http_headers.items() if name not in self.SKIP_HEADERS}
+        body = record.body
+        if record.content_type.startswith('text/html'):
+            for origin in self.origins:
+                body = body.replace(origin.encode('ascii'), base_url.encode('ascii'))
+        if 'location' in headers:
+            for origin in self.origins:
+                headers['location'] = headers['location'].replace(origin, base_url)
+        return record.status or 200, headers, body
+
+class ReplayServer:
+    def __init__(self, site, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1, seed=0):
+        self.site = site
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    def handler_class(self):
+        server = self
+
+        # keep-alive の接続でヘッダと本文を別々に送ると、Nagle アルゴリズムとクライアントの遅延ACKで
+        # 1リクエストごとに数十ミリ秒待たされる（接続を使い回すクライアントほど遅く測定される）ため、
+        # 応答をまとめて書き込み、TCP_NODELAY を設定する
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            wbufsize = -1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                status, headers, body = server.respond(self.path)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def respond(self, path):
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            error = self.rng.random() < self.error_rate
+            if error:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if path == '/robots.txt':
+            return 200, {'Content-Type': 'text/plain'}, b'User-agent: *\nAllow: /\n'
+        if error:
+            return 503, {'Content-Type': 'text/html', 'Retry-After': str(self.retry_after)}, b'<html><body>Service Unavailable</body></html>'
+        return self.site.get(path, self.base_url)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def build_site(args):
+    if args.cdx:
+        return RecordedSite(args.cdx)
+    return SyntheticSite(pages=args.pages, fanout=args.fanout, cross_links=args.cross_links,
+                         page_bytes=args.page_bytes, encoding=args.encoding, seed=args.seed)
+
+def add_arguments(parser):
+    parser.add_argument('--cdx', nargs='+', help='warc_file で保存したクロール結果の CDX 索引（複数ワーカーの場合はワーカーごとの CDX を並べる。指定しない場合は生成したサイト）')
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--fanout', type=int, default=5)
+    parser.add_argument('--cross-links', type=int, default=3)
+    parser.add_argument('--page-bytes', type=int, default=8000)
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--latency', type=float, default=0.0, help='応答の遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='遅延のゆらぎ（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='503 を返す割合')
+    parser.add_argument('--seed', type=int, default=0)
+
+# 単独で起動する
+#   python replay_server.py --port 8765 --pages 1000 --latency 0.05 --error-rate 0.01
+#   python replay_server.py --port 8765 --cdx ./crawl.cdx
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local replay server for crawler testing')
+    add_arguments(parser)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    server = ReplayServer(build_site(args), port=args.port, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, seed=args.seed)
+    print(f"Serving on {server.base_url}/")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
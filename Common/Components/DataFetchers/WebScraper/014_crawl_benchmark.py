@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+try:
+    from lib.replay_server import ReplayServer, build_site, add_arguments
+except ImportError:
+    from replay_server import ReplayServer, build_site, add_arguments
+
+# ローカルの再生サーバー（lib/replay_server.py）に対して WebScraperStep を実行し、性能を測定する
+#
+# パイプラインのディレクトリ（web_scraper_step.py と lib/ がある場所）で実行する。
+#   python crawl_benchmark.py --pages 1000 --latency 0.02 --concurrency 1 4 8
+#   python crawl_benchmark.py --cdx ./output/crawl.cdx --start-path /index.html --set link_extractor=selectolax
+# 測定値（concurrency ごと）
+#   pages/sec    : 保存したページ数 / クロールの所要時間
+#   CPU ms/page  : クロールしたプロセスのCPU時間（user + sys）/ ページ数
+#   peak RSS MB  : クロールしたプロセスの最大メモリ使用量
+# サーバーとクロールはそれぞれ別のプロセスで実行するため、サーバーの負荷やそれまでの実行のメモリは測定値に含まれない。
+# レート制限で所要時間が決まらないよう、既定では host_delay: 0・rate_limit_max: 1000 で実行する（--set で変更できる）。
+
+# 既定のステップ設定（--set で上書きする）
+BASE_CONFIG = {
+    'user_agent': 'crawl-benchmark',
+    'save_every': 100,
+    'host_delay': 0,
+    'rate_limit_max': 1000,
+    'sitemap': False,
+}
+
+def serve(args, ready):
+    server = ReplayServer(build_site(args), port=args.port, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, seed=args.seed)
+    ready.put(server.base_url)
+    server.httpd.serve_forever()
+
+# 1回分のクロールを子プロセスで実行し、測定値を queue に返す
+def crawl(step_config, work_dir, quiet, queue):
+    from web_scraper_step import WebScraperStep
+    output = open(os.devnull, 'w') if quiet else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            start_usage = resource.getrusage(resource.RUSAGE_SELF)
+            start = time.perf_counter()
+            step = WebScraperStep(step_config, download_dir=work_dir)
+            step.execute()
+            elapsed = time.perf_counter() - start
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+    except Exception as e:
+        queue.put({'concurrency': step_config['concurrency'], 'error': str(e)})
+        return
+    pages = len(step.visited)
+    cpu = (usage.ru_utime - start_usage.ru_utime) + (usage.ru_stime - start_usage.ru_stime)
+    queue.put({
+        'concurrency': step.concurrency,
+        'pages': pages,
+        'elapsed': elapsed,
+        'pages_per_sec': pages / elapsed if elapsed else 0.0,
+        'cpu_ms_per_page': cpu * 1000 / pages if pages else 0.0,
+        # Linux の ru_maxrss は KB 単位
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+    })
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+def run(args):
+    context = multiprocessing.get_context('fork')
+    ready = context.Queue()
+    server = context.Process(target=serve, args=(args, ready), daemon=True)
+    server.start()
+    base_url = ready.get(timeout=60)
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            work_dir = tempfile.mkdtemp(prefix='crawl_benchmark_')
+            step_config = {
+                **BASE_CONFIG,
+                'start_url': base_url + args.start_path,
+                'output_dir': work_dir,
+                'progress_file': os.path.join(work_dir, 'progress.json'),
+                'concurrency': concurrency,
+                'per_host_concurrency': concurrency,
+            }
+            for item in args.set or []:
+                key, _, value = item.partition('=')
+                step_config[key] = parse_value(value)
+            queue = context.Queue()
+            process = context.Process(target=crawl, args=(step_config, work_dir, not args.verbose, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            shutil.rmtree(work_dir, ignore_errors=True)
+            results.append(result)
+            if 'error' in result:
+                print(f"concurrency {result['concurrency']:>3}: Error: {result['error']}")
+                continue
+            print(f"concurrency {result['concurrency']:>3}: {result['pages']} pages in {result['elapsed']:.2f} s, "
+                  f"{result['pages_per_sec']:.1f} pages/sec, {result['cpu_ms_per_page']:.2f} CPU ms/page, "
+                  f"peak RSS {result['peak_rss_mb']:.1f} MB")
+    finally:
+        server.terminate()
+        server.join()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark WebScraperStep against a local replay server')
+    add_arguments(parser)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--start-path', default='/', help='クロールを開始するパス')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--set', action='append', help='ステップ設定の上書き（key=value、値は JSON として解釈する）')
+    parser.add_argument('--output', help='測定値を JSON で保存するファイル')
+    parser.add_argument('--verbose', action='store_true', help='クロール中の出力を表示する')
+    args = parser.parse_args()
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, ensure_ascii=False, indent=2)
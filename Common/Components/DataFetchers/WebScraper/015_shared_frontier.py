@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import sqlite3
+import threading
+try:
+    from lib.crawl_frontier import CrawlFrontier
+except ImportError:
+    from crawl_frontier import CrawlFrontier
+
+# 複数のワーカープロセスで共有するクロール対象URLのキュー（SQLite）
+#
+# CrawlFrontier と同じインターフェースで、URLの状態をデータベースに記録する。
+#   pending : 未訪問
+#   leased  : いずれかのワーカーが取得中（lease_expires まで）
+#   done    : 取得済み（保存ファイル・ETag 等・変化の有無を記録）
+#   dropped : 取得しなかった（robots.txtで不許可、エラー等）
+# pop() は未訪問のURLを1件、lease 秒の期限付きでこのワーカーに割り当てる。
+# ワーカーが異常終了した場合は期限切れのURLを別のワーカーが取り直すため、同じURLを重複して取得しない
+# （期限内に完了しなかった場合のみ取り直す）。
+class SharedFrontier:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS urls (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            depth INTEGER NOT NULL DEFAULT 0,
+            priority INTEGER NOT NULL DEFAULT 0,
+            state TEXT NOT NULL,
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            file TEXT,
+            validator TEXT,
+            changed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS urls_claim ON urls (state, priority, seq);
+    '''
+
+    # 優先度の計算は CrawlFrontier と同じ
+    priority_of = CrawlFrontier.priority_of
+
+    def __init__(self, path, worker_id=None, lease=300, poll_interval=1.0, priority='fifo', priority_patterns=None):
+        if priority not in ('fifo', 'depth', 'pattern'):
+            raise ValueError(f"Unknown frontier priority: {priority}")
+        self.path = path
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.priority = priority
+        self.priority_patterns = [re.compile(pattern) for pattern in (priority_patterns or [])]
+        self.lock = threading.Lock()
+        self.stats = {'claimed': 0, 'reclaimed': 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 非同期クロールではスレッドプールからも呼ばれるため、接続は lock で保護して共有する
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        # 同じ worker_id で再起動した場合、前回の実行で割り当てられたまま完了しなかったURLを未訪問に戻す
+        self.release_leases()
+
+    def execute(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    # 取得可能なURL（未訪問、または期限切れ）の条件
+    CLAIMABLE = "(state = 'pending' OR (state = 'leased' AND lease_expires < ?))"
+
+    def __len__(self):
+        return self.execute(f"SELECT COUNT(*) FROM urls WHERE {self.CLAIMABLE}", (time.time(),))[0][0]
+
+    def __bool__(self):
+        return bool(self.execute(f"SELECT 1 FROM urls WHERE {self.CLAIMABLE} LIMIT 1", (time.time(),)))
+
+    def __contains__(self, url):
+        return bool(self.execute('SELECT 1 FROM urls WHERE url = ?', (url,)))
+
+    # 訪問済みURLを登録する（キューには入れない）
+    def mark_seen(self, url):
+        self.execute("INSERT OR IGNORE INTO urls (url, state) VALUES (?, 'done')", (url,))
+
+    # 未登録のURLであればキューに追加して True を返す
+    def push(self, url, depth=0):
+        if not url:
+            return False
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO urls (url, depth, priority, state) VALUES (?, ?, ?, 'pending')",
+                (url, depth, self.priority_of(url, depth)))
+            return cursor.rowcount > 0
+
+    # 取り出し済みのURLをもう一度キューに追加する（一時的なエラーで取り直す場合）
+    def requeue(self, url, depth=0):
+        self.execute(
+            "UPDATE urls SET state = 'pending', depth = ?, worker = NULL, lease_expires = NULL WHERE url = ?",
+            (depth, url))
+        return True
+
+    # 優先度が最も高いURLをこのワーカーに割り当て、(url, depth) で返す
+    # 取得可能なURLが無い場合（他のワーカーが先に割り当てた場合を含む）は IndexError
+    def pop(self):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute(
+                    f"SELECT seq, url, depth, state FROM urls WHERE {self.CLAIMABLE} ORDER BY priority, seq LIMIT 1",
+                    (now,)).fetchone()
+                if row:
+                    self.connection.execute(
+                        "UPDATE urls SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE seq = ?",
+                        (self.worker_id, now + self.lease, row[0]))
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        if row is None:
+            raise IndexError('pop from empty frontier')
+        self.stats['claimed'] += 1
+        if row[3] == 'leased':
+            self.stats['reclaimed'] += 1
+        return row[1], row[2]
+
+    # 取得が完了したURLを記録する
+    def complete(self, url, filename, validator=None, changed=False):
+        self.execute(
+            "UPDATE urls SET state = 'done', worker = NULL, lease_expires = NULL, file = ?, validator = ?, changed = ? WHERE url = ?",
+            (filename, json.dumps(validator, ensure_ascii=False) if validator else None, int(changed), url))
+
+    # 取得しなかったURLを記録する
+    def drop(self, url):
+        self.execute("UPDATE urls SET state = 'dropped', worker = NULL, lease_expires = NULL WHERE url = ?", (url,))
+
+    # このワーカーに割り当てられたURLを未訪問に戻す
+    def release_leases(self):
+        self.execute(
+            "UPDATE urls SET state = 'pending', worker = NULL, lease_expires = NULL WHERE state = 'leased' AND worker = ?",
+            (self.worker_id,))
+
+    # キューが空のとき、取得中のURLがあれば（新しいリンクが追加される・期限切れで取り直す可能性があるため）
+    # poll_interval 秒待って True を返す。全てのワーカーの処理が終わっていれば False
+    # （呼び出し側は自分の取得が全て終わってから呼ぶため、このワーカーに割り当てられたURLも待つ対象に含める）
+    def wait_for_work(self):
+        rows = self.execute("SELECT 1 FROM urls WHERE state IN ('pending', 'leased') LIMIT 1")
+        if not rows:
+            return False
+        time.sleep(self.poll_interval)
+        return True
+
+    # キューに残っている (url, depth) を優先度順に列挙する（他のワーカーが取得中のURLは含めない）
+    def pending(self):
+        rows = self.execute(
+            f"SELECT url, depth FROM urls WHERE {self.CLAIMABLE} ORDER BY priority, seq", (time.time(),))
+        for url, depth in rows:
+            yield url, depth
+
+    # 全ワーカーの結果を progress.json と同じ形式で返す
+    def progress_data(self):
+        visited = {}
+        validators = {}
+        changed = []
+        for url, filename, validator, is_changed in self.execute(
+                "SELECT url, file, validator, changed FROM urls WHERE state = 'done' AND file IS NOT NULL ORDER BY seq"):
+            visited[url] = filename
+            if validator:
+                validators[url] = json.loads(validator)
+            if is_changed:
+                changed.append(url)
+        pending = self.execute(
+            "SELECT url, depth FROM urls WHERE state IN ('pending', 'leased') ORDER BY priority, seq")
+        return {
+            'visited': visited,
+            'to_visit': [url for url, _ in pending],
+            'to_visit_depth': [depth for _, depth in pending],
+            'validators': validators,
+            'changed': changed
+        }
+
+    # progress.json 形式の状態（単独のクロールの途中経過など）から訪問済みURLを共有キューに取り込む
+    # （未訪問URLは呼び出し側で push する）
+    def import_progress(self, progress_data):
+        validators = progress_data.get('validators', {})
+        changed = set(progress_data.get('changed', []))
+        for url, filename in progress_data.get('visited', {}).items():
+            self.push(url)
+            self.complete(url, filename, validators.get(url), url in changed)
+
+    # 後続ステップ向けに progress.json 形式で書き出す（他のワーカーと同時に書き出しても壊れないよう置き換える）
+    def export(self, progress_file):
+        tmp_path = f"{progress_file}.{self.worker_id}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.progress_data(), file, indent=2)
+        os.replace(tmp_path, progress_file)
+
+    def counts(self):
+        return dict(self.execute('SELECT state, COUNT(*) FROM urls GROUP BY state'))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def print_summary(self):
+        print(f"Shared frontier ({self.worker_id}): {self.stats['claimed']} claimed "
+              f"({self.stats['reclaimed']} expired leases), {self.counts()}")
+
+# 共有キューの状態の表示・progress.json への書き出し
+#   python shared_frontier.py status <db_file>
+#   python shared_frontier.py export <db_file> <progress_file>
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == 'status':
+        print(SharedFrontier(sys.argv[2], worker_id='status').counts())
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'export':
+        SharedFrontier(sys.argv[2], worker_id='export').export(sys.argv[3])
+    else:
+        print("usage: shared_frontier.py status <db_file> | export <db_file> <progress_file>")
@@ -0,0 +1,233 @@
+import os
+import sys
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+# ヒストグラム（Prometheus の histogram と同じく、上限ごとの累積件数・合計・件数を持つ）
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    # (上限, 累積件数) を返す（最後は +Inf）
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield float('inf'), self.count
+
+# クロールの計測値（カウンター・ヒストグラム・ゲージ）を集計し、Prometheus のテキスト形式で出力する
+#
+#   {prefix}_requests_total{host,status}     : 応答のステータスごとのリクエスト数
+#   {prefix}_fetch_errors_total{host}        : 接続エラー・タイムアウト等で応答が無かったリクエスト数
+#   {prefix}_robots_denied_total{host}       : robots.txt で不許可だったURL数
+#   {prefix}_response_bytes_total{host}      : 受信したバイト数
+#   {prefix}_fetch_seconds{host}             : 1ページの取得時間（本文の受信・バイナリの保存を含む）のヒストグラム
+#   {prefix}_page_bytes{host}                : 1ページの大きさのヒストグラム
+#   {prefix}_parse_seconds{host}             : リンク抽出の時間のヒストグラム
+#   ゲージ（add_gauge で登録）                : キューの長さ、取得中・訪問済みのURL数、ホストごとのリクエストレートなど
+# export() で metrics_file への書き出し（node_exporter の textfile collector 向け）と
+# metrics_port の HTTP エンドポイント（/metrics）を開始する。
+class CrawlMetrics:
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+    PARSE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+    HELP = {
+        'requests_total': ('counter', 'HTTP responses by status code'),
+        'fetch_errors_total': ('counter', 'Requests that failed without a response'),
+        'robots_denied_total': ('counter', 'URLs disallowed by robots.txt'),
+        'response_bytes_total': ('counter', 'Response body bytes received'),
+        'fetch_seconds': ('histogram', 'Time to fetch a page including the body'),
+        'page_bytes': ('histogram', 'Response body size per page'),
+        'parse_seconds': ('histogram', 'Time spent extracting links from a page'),
+    }
+
+    def __init__(self, prefix='web_scraper'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # (名前, ラベルのタプル) → 値 / Histogram
+        self.counters = {}
+        self.histograms = {}
+        # 名前 → (説明, 呼び出すと {ラベルのタプル: 値} を返す関数) のリスト
+        self.gauges = {}
+        self.server = None
+        self.writer = None
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def host_labels(url):
+        return (('host', urlparse(url).netloc),)
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    # 出力時に値を取得するゲージを登録する（同じ名前で複数登録した場合はまとめて出力する）
+    def add_gauge(self, name, help_text, values):
+        with self.lock:
+            self.gauges.setdefault(name, (help_text, []))[1].append(values)
+
+    # ホストごとのリクエストレート・待ち時間（AdaptiveRateLimiter.summary()）をゲージとして登録する
+    def add_rate_limiter(self, rate_limiter):
+        self.add_gauge('rate_limit_requests_per_second', 'Current request rate per host',
+                       lambda: {(('host', host),): stats['rate'] for host, stats in rate_limiter.summary().items()})
+        self.add_gauge('rate_limit_waited_seconds', 'Total time spent waiting for the rate limit per host',
+                       lambda: {(('host', host),): stats['waited'] for host, stats in rate_limiter.summary().items()})
+
+    def record_fetch(self, url, status, elapsed, size):
+        labels = self.host_labels(url)
+        self.inc('requests_total', labels + (('status', str(status)),))
+        self.inc('response_bytes_total', labels, size)
+        self.observe('fetch_seconds', labels, elapsed, self.LATENCY_BUCKETS)
+        self.observe('page_bytes', labels, size, self.BYTES_BUCKETS)
+
+    def record_error(self, url):
+        self.inc('fetch_errors_total', self.host_labels(url))
+
+    def record_robots_denied(self, url):
+        self.inc('robots_denied_total', self.host_labels(url))
+
+    def record_parse(self, url, elapsed):
+        self.observe('parse_seconds', self.host_labels(url), elapsed, self.PARSE_BUCKETS)
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    @staticmethod
+    def format_value(value):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    # Prometheus のテキスト形式
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(histogram.cumulative()), histogram.sum, histogram.count)
+                          for key, histogram in self.histograms.items()}
+            gauges = {name: (help_text, list(functions)) for name, (help_text, functions) in self.gauges.items()}
+        lines = []
+        for name, (metric_type, help_text) in self.HELP.items():
+            full_name = f"{self.prefix}_{name}"
+            if metric_type == 'counter':
+                samples = sorted((labels, value) for (key, labels), value in counters.items() if key == name)
+                if not samples:
+                    continue
+                lines += [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} counter"]
+                lines += [f"{full_name}{self.format_labels(labels)} {value}" for labels, value in samples]
+            else:
+                samples = sorted((labels, value) for (key, labels), value in histograms.items() if key == name)
+                if not samples:
+                    continue
+                lines += [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} histogram"]
+                for labels, (cumulative, total, count) in samples:
+                    for bound, bucket_count in cumulative:
+                        le = self.format_labels(labels + (('le', self.format_value(bound)),))
+                        lines.append(f"{full_name}_bucket{le} {bucket_count}")
+                    lines.append(f"{full_name}_sum{self.format_labels(labels)} {self.format_value(total)}")
+                    lines.append(f"{full_name}_count{self.format_labels(labels)} {count}")
+        for name, (help_text, functions) in sorted(gauges.items()):
+            full_name = f"{self.prefix}_{name}"
+            lines += [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} gauge"]
+            for values in functions:
+                try:
+                    samples = values()
+                except Exception as e:
+                    print(f"Error collecting metric {full_name}: {e}")
+                    continue
+                lines += [f"{full_name}{self.format_labels(labels)} {self.format_value(value)}"
+                          for labels, value in samples.items()]
+        return '\n'.join(lines) + '\n'
+
+    # 書き出し中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+    def write_file(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Metrics: http://{host}:{self.server.server_address[1]}/metrics")
+
+    # metrics_file には interval 秒ごとに書き出し、metrics_port では HTTP で公開する
+    def export(self, path=None, port=None, interval=10.0, host='127.0.0.1'):
+        if port:
+            self.serve(int(port), host)
+        if path:
+            def write_periodically():
+                while not self.stopped.wait(interval):
+                    try:
+                        self.write_file(path)
+                    except OSError as e:
+                        print(f"Error writing metrics to {path}: {e}")
+
+            self.writer = (path, threading.Thread(target=write_periodically, daemon=True))
+            self.writer[1].start()
+
+    # 最終的な値を書き出して終了する
+    def close(self):
+        self.stopped.set()
+        if self.writer:
+            path, thread = self.writer
+            thread.join()
+            self.write_file(path)
+            self.writer = None
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# 書き出した計測値のうち、名前に指定した文字列を含むものを表示する
+#   python crawl_metrics.py <metrics_file> [name]
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        with open(sys.argv[1], 'r', encoding='utf-8') as file:
+            for line in file:
+                if not line.startswith('#') and (len(sys.argv) < 3 or sys.argv[2] in line):
+                    print(line, end='')
+    else:
+        print("usage: crawl_metrics.py <metrics_file> [name]")
@@ -57,6 +57,6 @@ class ColumnManager:
         for child in node.children:
             service[child.title] = "  ".join(child.items)
         print(f'find table : title = {service["名称"]}, summary = {service["概要"]}')
-        node.htag_tables.append(pd.DataFrame([service]))
+        node.add_htag_table(service)
             
 
@@ -0,0 +1,99 @@
+from bs4.element import Tag, NavigableString, CData
+
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# get_text() が対象とする文字列の型（コメント・script・style の中身は含めない）
+TEXT_TYPES = (NavigableString, CData)
+
+# 見出しタグの階層構造（HTagNode の木）を作成する
+#
+# body 以下の要素を文書の順に1回だけたどり（開始・文字列・終了の順に処理する）、
+#   h1〜h6    : 見出しのノードを追加する（タイトルは見出しの中の文字列）
+#   table     : 現在の見出しのノードに表を追加する
+#   item_tags : 現在の見出しのノードに要素の中の文字列を追加する
+# 文字列はそれを囲む最も内側の見出し・項目の要素にだけ追加するため、
+# 項目や見出しの中に入れ子になった p / span / li は外側の要素にまとめ、同じ文字列を重ねて追加しない。
+# （find_all で全ての要素に get_text を呼ぶ方法では、<li><p>...</p></li> や <h2><span>...</span></h2> の文字列が重複する）
+class HTagTreeBuilder:
+    def __init__(self, item_tags=('p', 'span', 'li')):
+        self.item_tags = frozenset(item_tags)
+
+    # body 以下の見出し・表・項目を文書の順に並べたリストを返す
+    #   ['heading', レベル, タイトル] / ['table', table の要素] / ['item', 文字列]
+    # 見出し・項目は開始した位置に置き、文字列は要素の終わりで設定する
+    def events(self, body):
+        events = []
+        # 開いている見出し・項目の要素: (要素, 文字列のリスト, イベント)
+        open_elements = []
+        stack = [(body, iter(body.contents))]
+        while stack:
+            tag, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if open_elements and open_elements[-1][0] is tag:
+                    _, parts, event = open_elements.pop()
+                    event[-1] = ''.join(parts)
+                continue
+            if isinstance(child, Tag):
+                name = child.name
+                if name in HEADING_TAGS:
+                    event = ['heading', int(name[1]), '']
+                    events.append(event)
+                    open_elements.append((child, [], event))
+                elif name == 'table':
+                    events.append(['table', child])
+                elif name in self.item_tags and not open_elements:
+                    event = ['item', '']
+                    events.append(event)
+                    open_elements.append((child, [], event))
+                stack.append((child, iter(child.contents)))
+            elif open_elements and type(child) in TEXT_TYPES:
+                text = child.strip()
+                if text:
+                    open_elements[-1][1].append(text)
+        return events
+
+    # events の見出し・表・項目を root の下に追加し、最後の見出しのノードを返す
+    # 見出しのノードは root と同じクラスで作成する
+    def replay(self, root, events):
+        node_class = type(root)
+        current = root
+        for event in events:
+            kind = event[0]
+            if kind == 'heading':
+                node = node_class(event[2], event[1])
+                # 新しいノードのレベル以上のノードを遡って親を見つける
+                while current.level >= node.level:
+                    current = current.parent
+                current.add_child(node)
+                current = node
+            elif kind == 'table':
+                current.add_table(event[1])
+            else:
+                current.add_item(event[1])
+        return current
+
+    # root の下に body の見出し構造を追加し、最後の見出しのノードを返す
+    def build(self, root, body):
+        return self.replay(root, self.events(body))
+
+# 従来の方法（find_all で該当する全ての要素を取り出し、それぞれに get_text を呼ぶ）で木を作成する
+# 入れ子の要素の文字列は重複して追加される（比較・ベンチマーク用）
+def build_tree_find_all(root, body, item_tags=('p', 'span', 'li')):
+    node_class = type(root)
+    current = root
+    for tag in body.find_all(list(HEADING_TAGS) + ['table'] + list(item_tags), recursive=True):
+        if tag.name in HEADING_TAGS:
+            node = node_class(tag.get_text(strip=True), int(tag.name[1]))
+            if node.level > current.level:
+                current.add_child(node)
+            else:
+                while current.level >= node.level:
+                    current = current.parent
+                current.add_child(node)
+            current = node
+        elif tag.name == 'table':
+            current.add_table(tag)
+        else:
+            current.add_item(tag.get_text(strip=True))
+    return current
@@ -0,0 +1,104 @@
+import json
+import time
+import argparse
+from bs4 import BeautifulSoup
+try:
+    from lib.htag_node import HTagNode
+    from lib.htag_tree_builder import HTagTreeBuilder, build_tree_find_all
+    from lib.page_store import PageReader
+except ImportError:
+    from htag_node import HTagNode
+    from htag_tree_builder import HTagTreeBuilder, build_tree_find_all
+    from page_store import PageReader
+
+# 保存済みのクロール結果（progress.json）の HTML から見出しの木を作成し、
+# HTagTreeBuilder（1回だけたどる方法）と従来の find_all による方法を比較する
+#
+# パイプラインのディレクトリ（lib/ がある場所）で実行する。
+#   python htag_tree_benchmark.py ./output/progress.json
+#   python htag_tree_benchmark.py ./output/progress.json --item-tags p --repeat 3 --with-tables
+# 測定値（方法ごと）
+#   ms/page  : 木の作成にかかった時間（HTML の解析は含めない）/ ページ数
+#   items    : 追加した項目（段落などの文字列）の数と文字数
+# 見出し（レベル・タイトル）と表の数が一致しないページ数も表示する。
+# 表の変換（extract_table）は両方で同じ処理のため、既定では表を変換せずに測定する（--with-tables で変換する）。
+
+# 表を変換しないノード（木の作成そのものの時間を測定する）
+class TableSkippingNode(HTagNode):
+    __slots__ = ()
+
+    def add_table(self, table):
+        self.tables = [*self.tables, table]
+
+# 見出しの構造・表の数・項目の数と文字数
+def tree_stats(root):
+    headings = []
+    tables = 0
+    items = 0
+    chars = 0
+    for node in root.walk():
+        headings.append((node.level, node.title))
+        tables += len(node.tables)
+        items += len(node.items)
+        chars += sum(len(item) for item in node.items)
+    return headings, tables, items, chars
+
+def measure(build, soup, node_class, repeat):
+    best = None
+    for _ in range(repeat):
+        root = node_class('Root', level=0)
+        start = time.perf_counter()
+        build(root, soup.body)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, tree_stats(root)
+
+def run(args):
+    node_class = HTagNode if args.with_tables else TableSkippingNode
+    builder = HTagTreeBuilder(item_tags=args.item_tags)
+    methods = {
+        'find_all': lambda root, body: build_tree_find_all(root, body, args.item_tags),
+        'single_pass': builder.build,
+    }
+    results = {name: {'seconds': 0.0, 'items': 0, 'chars': 0} for name in methods}
+    pages = 0
+    different = []
+    for url, html_content in PageReader(args.progress_file).iter_pages():
+        soup = BeautifulSoup(html_content, args.parser)
+        if soup.body is None:
+            continue
+        stats = {}
+        for name, build in methods.items():
+            elapsed, stats[name] = measure(build, soup, node_class, args.repeat)
+            results[name]['seconds'] += elapsed
+            results[name]['items'] += stats[name][2]
+            results[name]['chars'] += stats[name][3]
+        if stats['find_all'][:2] != stats['single_pass'][:2]:
+            different.append(url)
+        pages += 1
+        if args.limit and pages >= args.limit:
+            break
+    for name, result in results.items():
+        result['ms_per_page'] = result['seconds'] * 1000 / pages if pages else 0.0
+        print(f"{name:>11}: {result['ms_per_page']:.2f} ms/page, {result['items']} items, {result['chars']} chars")
+    if results['single_pass']['seconds']:
+        print(f"speedup: {results['find_all']['seconds'] / results['single_pass']['seconds']:.2f}x over {pages} pages")
+    print(f"pages with different headings or tables: {len(different)}")
+    for url in different[:10]:
+        print(f"  {url}")
+    return {'pages': pages, 'results': results, 'different': different}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare HTagTreeBuilder with the find_all based tree builder')
+    parser.add_argument('progress_file', help='クロール結果の progress.json')
+    parser.add_argument('--item-tags', nargs='+', default=['p', 'span', 'li'], help='項目として追加するタグ')
+    parser.add_argument('--parser', default='html.parser', help='BeautifulSoup のパーサー')
+    parser.add_argument('--repeat', type=int, default=1, help='ページごとの繰り返し回数（最短の時間を使う）')
+    parser.add_argument('--limit', type=int, default=0, help='測定するページ数の上限')
+    parser.add_argument('--with-tables', action='store_true', help='表を DataFrame に変換して測定する')
+    parser.add_argument('--output', help='測定値を JSON で保存するファイル')
+    args = parser.parse_args()
+    summary = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), **summary}, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,164 @@
+import os
+import sys
+import zlib
+import marshal
+import hashlib
+import bs4
+from bs4 import BeautifulSoup
+try:
+    from lib.htag_tree_builder import HTagTreeBuilder, HEADING_TAGS
+    from lib.table_extractor import extract_table
+except ImportError:
+    from htag_tree_builder import HTagTreeBuilder, HEADING_TAGS
+    from table_extractor import extract_table
+
+# 解析結果の形式を変更した場合に上げる（古いキャッシュは使われなくなる）
+ARTIFACT_VERSION = 2
+
+# HTMLの解析結果（メインのdivのHTML、見出しの木、見出し以降の文字列など）のキャッシュ
+#
+# ページの内容の sha256 とパーサーのバージョン（ARTIFACT_VERSION・パーサー名・BeautifulSoup のバージョン）を
+# キーとして、解析結果を {cache_dir}/{sha256の先頭2文字}/{sha256}.{バージョン}.bin に保存する。
+# ファイルは解析結果の辞書を marshal でバイト列にし、zlib で圧縮したもの。
+# 同じ内容のページは、再実行時や同じパイプラインの別のステップでは解析せずにキャッシュから読み込む。
+# cache_dir を指定しない場合はファイルに保存せず、同じステップの中でだけ解析結果を使い回す。
+class ParseCache:
+    def __init__(self, cache_dir=None, parser='html.parser', level=6):
+        self.cache_dir = cache_dir
+        self.parser = parser
+        self.level = level
+        self.version = hashlib.sha256(
+            f"{ARTIFACT_VERSION}|{parser}|{bs4.__version__}".encode('utf-8')).hexdigest()[:12]
+        self.stats = {'pages': 0, 'hits': 0, 'parsed': 0, 'written': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{self.version}.bin")
+
+    def load(self, digest):
+        if not self.cache_dir:
+            return {}
+        try:
+            with open(self.path(digest), 'rb') as file:
+                return marshal.loads(zlib.decompress(file.read()))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, EOFError, TypeError, zlib.error) as e:
+            print(f"Error reading parse cache for {digest}: {e}")
+            return {}
+
+    def save(self, digest, artifacts):
+        if not self.cache_dir:
+            return
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(zlib.compress(marshal.dumps(artifacts), self.level))
+            os.replace(tmp_path, path)
+            self.stats['written'] += 1
+        except OSError as e:
+            print(f"Error writing parse cache for {digest}: {e}")
+
+    # ページの内容（文字列またはバイト列）の解析結果を返す
+    def page(self, content):
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        digest = hashlib.sha256(data).hexdigest()
+        self.stats['pages'] += 1
+        return ParsedPage(self, digest, content)
+
+    def print_summary(self):
+        stats = self.stats
+        print(f"Parse cache ({self.cache_dir or 'memory'}): {stats['pages']} pages, {stats['hits']} hits, "
+              f"{stats['parsed']} parsed, {stats['written']} written")
+
+# 1ページ分の解析結果
+# 各メソッドはキャッシュにあればそれを返し、無ければ HTML を解析して（ページごとに1回だけ）結果をキャッシュに追加する。
+class ParsedPage:
+    def __init__(self, cache, digest, content):
+        self.cache = cache
+        self.digest = digest
+        self.content = content
+        self.artifacts = cache.load(digest)
+        self._soup = None
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.content, self.cache.parser)
+            self.cache.stats['parsed'] += 1
+        return self._soup
+
+    # name の解析結果を返す（無ければ compute(soup) で作成してキャッシュに保存する）
+    # 解析結果は marshal で保存できる値（str / int / float / None / list / tuple / dict）に限る
+    def get(self, name, compute):
+        if name in self.artifacts:
+            self.cache.stats['hits'] += 1
+            return self.artifacts[name]
+        value = compute(self.soup)
+        self.artifacts[name] = value
+        self.cache.save(self.digest, self.artifacts)
+        return value
+
+    def main_div(self, soup, main_id):
+        return soup.find('div', id=main_id) if main_id else soup
+
+    # メインのdiv（id が main_id の div）のHTML。見つからない場合は None
+    def main_html(self, main_id='contents'):
+        def compute(soup):
+            main_div = self.main_div(soup, main_id)
+            return str(main_div) if main_div else None
+        return self.get(f"main_html:{main_id}", compute)
+
+    # メインのdiv（main_id が None の場合はページ全体）の見出しの文字列のリスト。div が見つからない場合は None
+    def headings(self, main_id=None):
+        def compute(soup):
+            main_div = self.main_div(soup, main_id)
+            if not main_div:
+                return None
+            return [tag.get_text() for tag in main_div.find_all(list(HEADING_TAGS))]
+        return self.get(f"headings:{main_id}", compute)
+
+    # 最初の見出しから文書の最後までの文字列（見出しが無い場合は None）
+    def text_from_first_heading(self):
+        def compute(soup):
+            heading = soup.find(list(HEADING_TAGS))
+            if heading is None:
+                return None
+            return ''.join(str(string) for string in heading.find_all_next(string=True))
+        return self.get('text_from_first_heading', compute)
+
+    # body の見出し構造（HTagTreeBuilder.events）。表は extract_table の行のリストで保存する
+    # 変換できない表は HTML の文字列で保存する（木を作成する時に add_table で同じエラーになる）
+    def tree_events(self, item_tags=('p', 'span', 'li')):
+        def table_event(table):
+            try:
+                return ['table', extract_table(table)]
+            except (ValueError, IndexError):
+                return ['table', str(table)]
+
+        def compute(soup):
+            events = HTagTreeBuilder(item_tags).events(soup.body)
+            return [table_event(event[1]) if event[0] == 'table' else event for event in events]
+        return self.get(f"tree:{','.join(item_tags)}", compute)
+
+    # root の下に見出しの木を作成し、最後の見出しのノードを返す
+    def build_tree(self, root, item_tags=('p', 'span', 'li')):
+        return HTagTreeBuilder(item_tags).replay(root, self.tree_events(item_tags))
+
+# キャッシュのファイル数・大きさを表示する
+#   python parse_cache.py <cache_dir>
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        files = 0
+        size = 0
+        for directory, _, filenames in os.walk(sys.argv[1]):
+            for filename in filenames:
+                if filename.endswith('.bin'):
+                    files += 1
+                    size += os.path.getsize(os.path.join(directory, filename))
+        print(f"{files} files, {size} bytes")
+    else:
+        print("usage: parse_cache.py <cache_dir>")
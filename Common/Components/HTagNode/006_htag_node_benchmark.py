@@ -0,0 +1,155 @@
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+from bs4 import BeautifulSoup
+try:
+    from lib.htag_node import HTagNode
+    from lib.htag_tree_builder import HTagTreeBuilder
+    from lib.page_store import PageReader
+except ImportError:
+    from htag_node import HTagNode
+    from htag_tree_builder import HTagTreeBuilder
+    from page_store import PageReader
+
+# 保存済みのクロール結果（progress.json）の HTML から見出しの木を作成し、
+# HTagNode.get_content（再帰しない・th ごとにキャッシュする方法）と従来の再帰的な方法、
+# __slots__ のノードと従来の（__dict__ を持つ）ノードのメモリ使用量を比較する
+#
+# パイプラインのディレクトリ（lib/ がある場所）で実行する。
+#   python htag_node_benchmark.py ./output/progress.json
+#   python htag_node_benchmark.py ./output/progress.json --repeat 3 --limit 500
+# 測定値
+#   get_content ms/page : HtmlConverter と同じく全てのノードで get_content() を呼び、
+#                         最上位の見出しで th = 1〜6 の get_content(th) を呼んだ時間 / ページ数
+#   bytes/node          : 全ページの木を保持した状態のメモリ使用量（tracemalloc）/ ノード数
+# 2つの方法の get_content の結果が一致しないページ数も表示する。
+
+# 表を変換しないノード（表は木の作成・get_content に関係しないため）
+class TableSkippingNode(HTagNode):
+    __slots__ = ()
+
+    def add_table(self, table):
+        self.tables = [*self.tables, table]
+
+# 従来のノード（属性を __dict__ に持つ。メモリ使用量の比較用）
+class DictNode:
+    def __init__(self, title, level, parent=None):
+        self.title = title
+        self.level = level
+        self.parent = parent
+        self.children = []
+        self.items = []
+        self.htag_tables = []
+        self.tables = []
+
+    def add_child(self, child):
+        current_node = self
+        while current_node.level >= child.level and current_node.parent is not None:
+            current_node = current_node.parent
+        current_node.children.append(child)
+        child.parent = current_node
+
+    def add_item(self, item):
+        self.items.append(item)
+
+    def add_table(self, table):
+        self.tables.append(table)
+
+# 従来の get_content（子の結果を連結するたびにリストを作り直す）
+def recursive_content(node, th=7):
+    if node.level >= th:
+        return []
+    child_content_list = []
+    for child in node.children:
+        child_content_list += recursive_content(child, th)
+    content_list = node.truncate_content([node.title] + list(node.items) + child_content_list)
+    return [s for s in content_list if len(s) > 1]
+
+# HtmlConverter.collect_data_from_nodes / create_title と同じ呼び出し方
+def workload(root, get_content):
+    results = [get_content(node) for node in root.walk()]
+    for child in root.children:
+        results += [get_content(child, th) for th in range(1, 7)]
+    return results
+
+def measure(root, get_content, repeat):
+    best = None
+    for _ in range(repeat):
+        # キャッシュの無い状態から測定する
+        for node in root.walk():
+            node.invalidate()
+        start = time.perf_counter()
+        results = workload(root, get_content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+def tree_memory(node_class, events_list, builder):
+    gc.collect()
+    tracemalloc.start()
+    roots = []
+    for events in events_list:
+        root = node_class('Root', level=0)
+        builder.replay(root, events)
+        roots.append(root)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, roots
+
+def run(args):
+    builder = HTagTreeBuilder(item_tags=args.item_tags)
+    events_list = []
+    for url, html_content in PageReader(args.progress_file).iter_pages():
+        soup = BeautifulSoup(html_content, args.parser)
+        if soup.body is None:
+            continue
+        # 表は要素への参照を残さず、文字列で持つ（木のメモリ使用量に HTML の解析結果を含めない）
+        events_list.append((url, [[event[0], str(event[1])] if event[0] == 'table' else event
+                                  for event in builder.events(soup.body)]))
+        if args.limit and len(events_list) >= args.limit:
+            break
+    pages = len(events_list)
+    seconds = {'recursive': 0.0, 'cached': 0.0}
+    different = []
+    depth = 0
+    for url, events in events_list:
+        root = TableSkippingNode('Root', level=0)
+        builder.replay(root, events)
+        depth = max(depth, max(node.level for node in root.walk()))
+        elapsed, expected = measure(root, recursive_content, args.repeat)
+        seconds['recursive'] += elapsed
+        elapsed, actual = measure(root, lambda node, th=7: node.get_content(th), args.repeat)
+        seconds['cached'] += elapsed
+        if actual != expected:
+            different.append(url)
+    memory = {}
+    for name, node_class in (('dict', DictNode), ('slots', TableSkippingNode)):
+        memory[name], roots = tree_memory(node_class, [events for _, events in events_list], builder)
+        del roots
+    nodes = pages + sum(1 for _, events in events_list for event in events if event[0] == 'heading')
+    for name, value in seconds.items():
+        print(f"get_content {name:>9}: {value * 1000 / pages if pages else 0.0:.3f} ms/page")
+    if seconds['cached']:
+        print(f"speedup: {seconds['recursive'] / seconds['cached']:.2f}x over {pages} pages (max level {depth})")
+    for name, value in memory.items():
+        print(f"memory {name:>5}: {value / 1024 / 1024:.1f} MB, {value / nodes if nodes else 0:.0f} bytes/node ({nodes} nodes)")
+    print(f"pages with different content: {len(different)}")
+    for url in different[:10]:
+        print(f"  {url}")
+    return {'pages': pages, 'nodes': nodes, 'seconds': seconds, 'memory': memory, 'different': different}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the cached HTagNode.get_content with the recursive one')
+    parser.add_argument('progress_file', help='クロール結果の progress.json')
+    parser.add_argument('--item-tags', nargs='+', default=['p', 'span', 'li'], help='項目として追加するタグ')
+    parser.add_argument('--parser', default='html.parser', help='BeautifulSoup のパーサー')
+    parser.add_argument('--repeat', type=int, default=1, help='ページごとの繰り返し回数（最短の時間を使う）')
+    parser.add_argument('--limit', type=int, default=0, help='測定するページ数の上限')
+    parser.add_argument('--output', help='測定値を JSON で保存するファイル')
+    args = parser.parse_args()
+    summary = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), **summary}, file, ensure_ascii=False, indent=2)
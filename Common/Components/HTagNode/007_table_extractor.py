@@ -0,0 +1,220 @@
+import re
+import sys
+from bs4 import BeautifulSoup
+from bs4.element import Tag, NavigableString, PreformattedString, Stylesheet
+
+# pd.read_html と同じ方法で余分な空白（改行・2文字以上の空白）を1つの空白にする
+RE_WHITESPACE = re.compile(r"[\r\n]+|\s{2,}")
+# read_html が表として扱う条件（改行以外の文字を含む文字列がある）
+RE_TEXT = re.compile(r".")
+# セルの文字列に含めない文字列の型（コメント・CDATA・宣言など、style の中身）
+SKIPPED_STRINGS = (PreformattedString, Stylesheet)
+CELL_TAGS = ('td', 'th')
+
+# table の要素から、pd.read_html(str(table))[0] と同じ内容の行のリストを直接作成する
+#
+# add_table で表ごとに str(table) → BeautifulSoup → pd.read_html と同じ HTML を3回解析していたものを、
+# 解析済みの要素を1回たどるだけにする。結果は marshal で保存できる辞書で、解析結果のキャッシュにもそのまま保存できる。
+#   {'caption': キャプション（無い場合は None）, 'head': 見出しの行, 'body': 本体の行, 'foot': 末尾の行}
+# 各行はセルの文字列のリストで、rowspan / colspan のセルは結合された位置に同じ文字列を繰り返す。
+# DataFrame は to_dataframe(data) で必要になった時に作成する（read_html と同じく TextParser で型を推定する）。
+#
+# read_html（lxml）と同じ規則
+#   行       : thead の直下の tr（tr が無く直下にセルがある thead はその thead）、tbody の下の tr と table 直下の tr、tfoot の下の tr
+#              thead が無い場合は、本体の先頭から th だけの行を見出しの行にする
+#   セル     : 行の直下の td / th
+#   文字列   : セルの中の全ての文字列（br は改行）を連結し、前後の空白を除いて余分な空白を1つの空白にする
+#   非表示   : style が display:none の要素と style 要素は除く
+#   エラー   : 文字列を含まない表は ValueError、全てのセルが空の表は IndexError（read_html の結果が空のリストになる場合）
+
+# style が display:none の要素か
+def is_hidden(tag):
+    style = tag.get('style')
+    return bool(style) and 'display:none' in str(style).replace(' ', '')
+
+# tag から table までの要素がすべて表示されるか
+def is_displayed(tag, table):
+    while tag is not None and tag is not table:
+        if is_hidden(tag):
+            return False
+        tag = tag.parent
+    return True
+
+# セルの文字列（read_html の text_content() と余分な空白の除去に合わせる）
+def cell_text(cell):
+    parts = []
+    stack = [iter(cell.contents)]
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+        elif isinstance(child, Tag):
+            if child.name == 'br':
+                parts.append('\n')
+            elif child.name != 'style' and not is_hidden(child):
+                stack.append(iter(child.contents))
+        elif isinstance(child, NavigableString) and not isinstance(child, SKIPPED_STRINGS):
+            parts.append(child)
+    return RE_WHITESPACE.sub(' ', ''.join(parts).strip())
+
+# thead / tbody / tfoot の行（read_html の _parse_thead_tr / _parse_tbody_tr / _parse_tfoot_tr と同じ順序）
+def section_rows(table):
+    head_rows = []
+    for thead in table.find_all('thead'):
+        head_rows += thead.find_all('tr', recursive=False)
+        if thead.find(CELL_TAGS, recursive=False):
+            head_rows.append(thead)
+    body_rows = []
+    foot_rows = []
+    for tr in table.find_all('tr'):
+        in_tbody = in_tfoot = False
+        parent = tr.parent
+        while parent is not None and parent is not table:
+            if parent.name == 'tbody':
+                in_tbody = True
+            elif parent.name == 'tfoot':
+                in_tfoot = True
+            parent = parent.parent
+        if in_tbody:
+            body_rows.append(tr)
+        if in_tfoot:
+            foot_rows.append(tr)
+    body_rows += table.find_all('tr', recursive=False)
+    return tuple([row for row in rows if is_displayed(row, table)] for rows in (head_rows, body_rows, foot_rows))
+
+# 行の直下の表示されるセル
+def row_cells(row):
+    return [cell for cell in row.find_all(CELL_TAGS, recursive=False) if not is_hidden(cell)]
+
+# rowspan / colspan を展開した行のリストと、次の部分に続く rowspan の残りを返す（read_html の _expand_colspan_rowspan と同じ）
+#   remainder : (列の位置, 文字列, 残りの行数) のリスト
+def expand_rows(rows, remainder=None, overflow=True):
+    all_texts = []
+    remainder = remainder if remainder is not None else []
+    for cells in rows:
+        texts = []
+        next_remainder = []
+        index = 0
+        for cell in cells:
+            # rowspan で上の行から続くセルのうち、このセルより前のもの
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+                index += 1
+            text = cell_text(cell)
+            rowspan = int(cell.get('rowspan') or 1)
+            colspan = int(cell.get('colspan') or 1)
+            for _ in range(colspan):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+        # 行の最後に続くセル
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        all_texts.append(texts)
+        remainder = next_remainder
+    if not overflow:
+        # rowspan だけで作られる行を追加する
+        while remainder:
+            next_remainder = []
+            texts = []
+            for prev_i, prev_text, prev_rowspan in remainder:
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+            all_texts.append(texts)
+            remainder = next_remainder
+    return all_texts, remainder
+
+# 表に改行以外の文字を含む文字列があるか（コメントは除く）
+def has_text(table):
+    return any(RE_TEXT.search(string) for string in table.find_all(string=True)
+               if not isinstance(string, PreformattedString))
+
+# table の要素（または table を含む HTML の文字列）から行のリストとキャプションを作成する
+def extract_table(table):
+    if not isinstance(table, Tag) or table.name != 'table':
+        table = BeautifulSoup(str(table), 'html.parser').find('table')
+        if table is None:
+            raise ValueError("No tables found")
+    if not has_text(table) or is_hidden(table):
+        raise ValueError("No tables found matching pattern '.+'")
+
+    head_rows, body_rows, foot_rows = section_rows(table)
+    head_cells = [row_cells(row) for row in head_rows]
+    body_cells = [row_cells(row) for row in body_rows]
+    foot_cells = [row_cells(row) for row in foot_rows]
+    if not head_cells:
+        # thead が無い場合、本体の先頭の th だけの行を見出しにする
+        while body_cells and all(cell.name == 'th' for cell in body_cells[0]):
+            head_cells.append(body_cells.pop(0))
+
+    head, remainder = expand_rows(head_cells)
+    body, remainder = expand_rows(body_cells, remainder, overflow=len(foot_cells) > 0)
+    foot, _ = expand_rows(foot_cells, remainder, overflow=False)
+    if not any(text for rows in (head, body, foot) for row in rows for text in row):
+        # read_html は空の表を返さないため、[0] が IndexError になる
+        raise IndexError("list index out of range")
+
+    caption = table.find('caption')
+    return {
+        'caption': caption.get_text(strip=True) if caption else None,
+        'head': head,
+        'body': body,
+        'foot': foot,
+    }
+
+# extract_table の結果から DataFrame を作成する（read_html の既定の引数で TextParser を使う）
+def to_dataframe(data):
+    from pandas.io.parsers import TextParser
+
+    head = data['head']
+    # 元の行のリストを変更しないように複製する
+    rows = [list(row) for row in head + data['body'] + data['foot']]
+    header = None
+    if head:
+        # 見出しの行が1行ならその行、複数なら空でない行を列名にする
+        if len(head) == 1:
+            header = 0
+        else:
+            header = [i for i, row in enumerate(head) if any(text for text in row)]
+    # 列の数が少ない行を空の文字列で埋める
+    width = max((len(row) for row in rows), default=0)
+    for row in rows:
+        if len(row) < width:
+            row += [''] * (width - len(row))
+    with TextParser(rows, header=header, index_col=None, skiprows=0, parse_dates=False,
+                    thousands=',', decimal='.', converters=None, na_values=None,
+                    keep_default_na=True) as parser:
+        return parser.read()
+
+# 表の数・行数を表示する
+def print_summary(tables):
+    rows = sum(len(data['head']) + len(data['body']) + len(data['foot']) for data in tables)
+    captions = sum(1 for data in tables if data['caption'] is not None)
+    print(f"Tables: {len(tables)} tables, {rows} rows, {captions} captions")
+
+# HTML ファイルの表を DataFrame に変換して表示する
+#   python table_extractor.py <html_file>
+if __name__ == "__main__":
+    if len(sys.argv) >= 2:
+        with open(sys.argv[1], 'r', encoding='utf-8') as file:
+            soup = BeautifulSoup(file.read(), 'html.parser')
+        tables = []
+        for table in soup.find_all('table'):
+            try:
+                data = extract_table(table)
+            except (ValueError, IndexError) as e:
+                print(f"Skip table: {e}")
+                continue
+            tables.append(data)
+            print(f"caption: {data['caption']}")
+            print(to_dataframe(data))
+        print_summary(tables)
+    else:
+        print("usage: table_extractor.py <html_file>")
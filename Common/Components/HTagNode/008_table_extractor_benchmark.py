@@ -0,0 +1,107 @@
+import json
+import time
+import argparse
+from io import StringIO
+import pandas as pd
+from bs4 import BeautifulSoup
+try:
+    from lib.table_extractor import extract_table, to_dataframe
+    from lib.page_store import PageReader
+except ImportError:
+    from table_extractor import extract_table, to_dataframe
+    from page_store import PageReader
+
+# 保存済みのクロール結果（progress.json）の HTML の全ての表について、
+# table_extractor（解析済みの要素から行のリストを作成する方法）と従来の add_table の方法
+# （str(table) → BeautifulSoup でキャプションを探す → pd.read_html）を比較する
+#
+# パイプラインのディレクトリ（lib/ がある場所）で実行する。
+#   python table_extractor_benchmark.py ./output/progress.json
+#   python table_extractor_benchmark.py ./output/progress.json --repeat 3 --limit 500
+# 測定値
+#   read_html ms/table : 従来の方法で DataFrame とキャプションを作成する時間 / 表の数
+#   extract   ms/table : extract_table で行のリストとキャプションを作成する時間 / 表の数
+#   frame     ms/table : extract_table に加えて to_dataframe で DataFrame を作成する時間 / 表の数
+# DataFrame（列名・値・型）・キャプション・エラーの種類が一致しない表の数も表示する。
+
+# 従来の add_table と同じ方法（pandas 2.1 以降は HTML の文字列を StringIO で渡す）
+def read_html_table(table):
+    soup = BeautifulSoup(str(table), 'html.parser')
+    caption = soup.find('caption')
+    caption_text = caption.get_text(strip=True) if caption else None
+    return pd.read_html(StringIO(str(table)))[0], caption_text
+
+def extract_frame(table):
+    data = extract_table(table)
+    return to_dataframe(data), data['caption']
+
+# 結果（または例外の種類）と時間
+def measure(function, table, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = function(table)
+        except (ValueError, IndexError) as e:
+            result = type(e).__name__
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def same_result(expected, actual):
+    if isinstance(expected, str) or isinstance(actual, str):
+        return expected == actual
+    (expected_df, expected_caption), (actual_df, actual_caption) = expected, actual
+    return (expected_caption == actual_caption
+            and list(expected_df.columns) == list(actual_df.columns)
+            and list(expected_df.dtypes) == list(actual_df.dtypes)
+            and expected_df.equals(actual_df))
+
+def run(args):
+    methods = {
+        'read_html': read_html_table,
+        'extract': extract_table,
+        'frame': extract_frame,
+    }
+    seconds = {name: 0.0 for name in methods}
+    tables = 0
+    errors = 0
+    different = []
+    for url, html_content in PageReader(args.progress_file).iter_pages():
+        soup = BeautifulSoup(html_content, args.parser)
+        for index, table in enumerate(soup.find_all('table')):
+            results = {}
+            for name, function in methods.items():
+                elapsed, results[name] = measure(function, table, args.repeat)
+                seconds[name] += elapsed
+            if isinstance(results['read_html'], str):
+                errors += 1
+            if not same_result(results['read_html'], results['frame']):
+                different.append((url, index))
+            tables += 1
+        if args.limit and tables >= args.limit:
+            break
+    for name, value in seconds.items():
+        print(f"{name:>9}: {value * 1000 / tables if tables else 0.0:.3f} ms/table")
+    if seconds['extract'] and seconds['frame']:
+        print(f"speedup: {seconds['read_html'] / seconds['extract']:.2f}x (rows only), "
+              f"{seconds['read_html'] / seconds['frame']:.2f}x (with DataFrame) over {tables} tables")
+    print(f"tables that read_html could not convert: {errors}")
+    print(f"tables with different results: {len(different)}")
+    for url, index in different[:10]:
+        print(f"  {url} (table {index})")
+    return {'tables': tables, 'errors': errors, 'seconds': seconds,
+            'different': [f"{url}#{index}" for url, index in different]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare table_extractor with pd.read_html on saved pages')
+    parser.add_argument('progress_file', help='クロール結果の progress.json')
+    parser.add_argument('--parser', default='html.parser', help='BeautifulSoup のパーサー')
+    parser.add_argument('--repeat', type=int, default=1, help='表ごとの繰り返し回数（最短の時間を使う）')
+    parser.add_argument('--limit', type=int, default=0, help='測定する表の数の上限')
+    parser.add_argument('--output', help='測定値を JSON で保存するファイル')
+    args = parser.parse_args()
+    summary = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), **summary}, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,91 @@
+import json
+import time
+import argparse
+try:
+    from lib.htag_node import HTagNode
+    from lib.parse_cache import ParseCache
+    from lib.page_store import PageReader
+except ImportError:
+    from htag_node import HTagNode
+    from parse_cache import ParseCache
+    from page_store import PageReader
+
+# 保存済みのクロール結果（progress.json）の HTML から見出しの木を作成し、
+# HtmlConverter.display_tree と同じデバッグ出力（全てのノードの repr）にかかる時間を、HTML の解析・木の作成の時間と比較する
+#
+# パイプラインのディレクトリ（lib/ がある場所）で実行する。
+#   python htag_tables_benchmark.py ./output/progress.json
+#   python htag_tables_benchmark.py ./output/progress.json --item-tags p --dumps 3
+# 測定値
+#   parse      ms/page : HTML の解析と木の作成（解析結果のキャッシュは使わない）
+#   uncached   ms/page : repr のたびに表を DataFrame にして連結する（従来の get_tables / get_htag_tables）
+#   cached     ms/page : 連結した結果をノードごとにキャッシュする
+# 1ページにつき --dumps 回デバッグ出力を作成し、2つの方法の出力が一致しないページ数も表示する。
+
+# 全てのノードの repr（display_tree と同じ字下げ）
+# uncached の場合は repr のたびに表のキャッシュを破棄する（従来の方法）
+def dump(root, uncached=False):
+    lines = []
+    nodes = [(root, 0)]
+    while nodes:
+        node, indent = nodes.pop()
+        if uncached:
+            node.clear_records()
+        lines.append(' ' * indent + repr(node))
+        nodes.extend((child, indent + 2) for child in reversed(node.children))
+    return '\n'.join(lines)
+
+def measure(function, root, dumps):
+    start = time.perf_counter()
+    for _ in range(dumps):
+        output = function(root)
+    return time.perf_counter() - start, output
+
+def run(args):
+    item_tags = tuple(args.item_tags)
+    seconds = {'parse': 0.0, 'uncached': 0.0, 'cached': 0.0}
+    pages = 0
+    tables = 0
+    different = []
+    for url, html_content in PageReader(args.progress_file).iter_pages():
+        start = time.perf_counter()
+        root = HTagNode('Root', level=0)
+        try:
+            ParseCache().page(html_content).build_tree(root, item_tags=item_tags)
+        except (ValueError, IndexError) as e:
+            print(f"Skip {url}: {e}")
+            continue
+        seconds['parse'] += time.perf_counter() - start
+        elapsed, expected = measure(lambda root: dump(root, uncached=True), root, args.dumps)
+        seconds['uncached'] += elapsed
+        for node in root.walk():
+            node.clear_records()
+        elapsed, actual = measure(dump, root, args.dumps)
+        seconds['cached'] += elapsed
+        if actual != expected:
+            different.append(url)
+        tables += sum(len(node.tables) for node in root.walk())
+        pages += 1
+        if args.limit and pages >= args.limit:
+            break
+    for name, value in seconds.items():
+        print(f"{name:>8}: {value * 1000 / pages if pages else 0.0:.3f} ms/page")
+    if seconds['cached']:
+        print(f"speedup: {seconds['uncached'] / seconds['cached']:.2f}x over {pages} pages ({tables} tables, {args.dumps} dumps/page)")
+    print(f"pages with different output: {len(different)}")
+    for url in different[:10]:
+        print(f"  {url}")
+    return {'pages': pages, 'tables': tables, 'seconds': seconds, 'different': different}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the cost of debug dumps of HTagNode trees with and without cached tables')
+    parser.add_argument('progress_file', help='クロール結果の progress.json')
+    parser.add_argument('--item-tags', nargs='+', default=['p', 'span', 'li'], help='項目として追加するタグ')
+    parser.add_argument('--dumps', type=int, default=2, help='ページごとにデバッグ出力を作成する回数')
+    parser.add_argument('--limit', type=int, default=0, help='測定するページ数の上限')
+    parser.add_argument('--output', help='測定値を JSON で保存するファイル')
+    args = parser.parse_args()
+    summary = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), **summary}, file, ensure_ascii=False, indent=2)
@@ -8,6 +8,7 @@ from download_step import DownloadStep
 from data_extraction_step import DataExtractionStep
 from attribution_processing_step import AttributionProcStep
 from web_scraper_step import WebScraperStep
+from multi_site_scraper_step import MultiSiteScraperStep
 #from web_data2csv_step import WebDataToCSVConvertStep
 from html2htaglayer_step import Html2HtagLayerStep
 from service_catalog_creator_step import ServiceCatalogCreatorStep
@@ -20,6 +21,7 @@ StepFactory.register_step('download_step', DownloadStep)
 StepFactory.register_step('data_extraction_step', DataExtractionStep)
 StepFactory.register_step('attribution_step', AttributionProcStep)
 StepFactory.register_step('web_scraper_step', WebScraperStep)
+StepFactory.register_step('multi_site_scraper_step', MultiSiteScraperStep)
 #StepFactory.register_step('web_data2csv_step', WebDataToCSVConvertStep)
 StepFactory.register_step('html2htaglayer_step', Html2HtagLayerStep)
 StepFactory.register_step('service_catalog_creator_step', ServiceCatalogCreatorStep)
@@ -1,9 +1,15 @@
 import requests
 import os
 import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 class DownloadStep:
-    def __init__(self, step_type, step_config):
+    # ハッシュを照合する場合に files の各要素で指定できるキー（先に見つかったものを使う）
+    CHECKSUM_KEYS = ('sha256', 'sha1', 'md5')
+
+    def __init__(self, step_type, step_config, workers=None, max_retries=None, summary_file="download_summary.json"):
         self.step_type = step_type
         # `config`が文字列（ファイルパス）の場合、その内容を読み込む
         with open(step_config, 'r') as f:
@@ -11,24 +17,110 @@ class DownloadStep:
         self.download_dir = "pipeline"
         # ダウンロードディレクトリが存在しない場合は作成
         os.makedirs(self.download_dir, exist_ok=True)
+        # 同時にダウンロードするファイル数と、失敗したダウンロードをやり直す回数
+        # （引数で指定しない場合は pipeline_download.json の workers / max_retries）
+        self.workers = int(workers or self.config_json.get('workers', 8))
+        self.max_retries = int(max_retries if max_retries is not None else self.config_json.get('max_retries', 3))
+        self.summary_file = summary_file
+        # 同じホストからの連続したダウンロードでは接続を使い回す
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-    def download_file(self, url, save_path):
-        """指定されたURLからファイルをダウンロードし、指定されたパスに保存する"""
-        try:
-            response = requests.get(url, stream=True)
-            response.raise_for_status()  # ステータスコードが200以外の場合は例外を発生させる
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+    def download_file(self, url, save_path, algorithm='sha256', expected=None):
+        """指定されたURLからファイルをダウンロードし、指定されたパスに保存する
+
+        ダウンロード中は {save_path}.part に書き込み、ハッシュを照合してから保存先に移動する。
+        .part が残っている場合は Range で続きから取得する（{save_path}.part.json に記録した ETag / Last-Modified を
+        If-Range に付け、サーバー側のファイルが変わっていれば最初から取得する）。
+        ETag / Last-Modified が記録されていない場合と 416 の場合は .part を削除して最初から取得する。
+        ハッシュが一致しない場合は ValueError
+        """
+        part_path = f"{save_path}.part"
+        info_path = f"{part_path}.json"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            info = self.load_part_info(info_path)
+            validator = info.get('etag') or info.get('last_modified')
+            if validator:
+                headers = {'Range': f"bytes={offset}-", 'If-Range': validator}
+            else:
+                self.discard_part(part_path, info_path)
+                offset = 0
+        with self.session.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 416 and offset:
+                # .part がサーバー側のファイルより長い（ファイルが変わった）ため、最初から取得し直す
+                self.discard_part(part_path, info_path)
+                return self.download_file(url, save_path, algorithm, expected)
+            response.raise_for_status()  # ステータスコードが200番台以外の場合は例外を発生させる
+            mode = 'ab' if response.status_code == 206 and offset else 'wb'
+            if mode == 'wb':
+                with open(info_path, 'w') as f:
+                    json.dump({'url': url, 'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')}, f)
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=65536):
                     f.write(chunk)
-            print(f"File downloaded successfully: {save_path}")
-        except requests.RequestException as e:
-            print(f"Failed to download {url}: {e}")
+        digest = hashlib.new(algorithm)
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        if expected and digest.hexdigest() != expected:
+            self.discard_part(part_path, info_path)
+            raise ValueError(f"{algorithm} mismatch: expected {expected}, got {digest.hexdigest()}")
+        os.replace(part_path, save_path)
+        if os.path.exists(info_path):
+            os.remove(info_path)
+        return digest.hexdigest()
 
-    def execute(self):
-        """ダウンロードステップを実行する"""
+    @staticmethod
+    def load_part_info(info_path):
+        try:
+            with open(info_path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    # 途中まで書き込んだ .part とその ETag / Last-Modified を削除する
+    @staticmethod
+    def discard_part(part_path, info_path):
+        for path in (part_path, info_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-        for file in self.config_json['files']:
-            url = file['url']
-            filename = file['filename']
-            save_path = os.path.join(self.download_dir, filename)
-            self.download_file(url, save_path)
+    def download(self, file):
+        """1ファイル分のダウンロード（失敗した場合は max_retries 回までやり直す）"""
+        url = file['url']
+        save_path = os.path.join(self.download_dir, file['filename'])
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        algorithm, expected = next(((key, file[key].strip().lower()) for key in self.CHECKSUM_KEYS if file.get(key)), ('sha256', None))
+        result = {'url': url, 'filename': file['filename'], 'status': 'failed'}
+        for attempt in range(self.max_retries + 1):
+            result['attempts'] = attempt + 1
+            try:
+                result[algorithm] = self.download_file(url, save_path, algorithm, expected)
+                result['status'] = 'downloaded'
+                result.pop('error', None)
+                print(f"File downloaded successfully: {save_path}")
+                break
+            except (requests.RequestException, ValueError, OSError) as e:
+                result['error'] = str(e)
+                # 4xx（429 を除く）はやり直さない
+                status = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+                if attempt < self.max_retries and (status is None or status == 429 or status >= 500):
+                    time.sleep(2 ** attempt)
+                    continue
+                print(f"Failed to download {url}: {e}")
+                break
+        return result
+
+    def execute(self):
+        """ダウンロードステップを実行する（workers 件ずつ並行してダウンロードする）"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.download, self.config_json['files']))
+        with open(self.summary_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        failed = [result['url'] for result in results if result['status'] == 'failed']
+        print(f"Downloads: {len(results) - len(failed)}/{len(results)} files (see {self.summary_file})")
@@ -2,17 +2,26 @@ from bs4 import BeautifulSoup
 import json
 import os
 import hashlib
+from lib.parse_cache import ParseCache
+from lib.page_store import page_extension, read_page
 
 
 
 class CatalogCreator:
-    def __init__(self, html_content, source_url):
+    def __init__(self, html_content, source_url, page=None):
         self.source_url = source_url
         self.html_content = html_content
-        self.services = self.parse_html_to_services()
-
-    def parse_html_to_services(self):
-        soup = BeautifulSoup(self.html_content, 'html.parser')
+        if page is None:
+            self.services = self.parse_html_to_services()
+        else:
+            # 解析結果はページの内容ごとにキャッシュする（URLは最上位の階層にのみ設定し直す）
+            self.services = page.get('catalog_services', self.parse_html_to_services)
+            for service in self.services:
+                service['url'] = self.source_url
+
+    def parse_html_to_services(self, soup=None):
+        if soup is None:
+            soup = BeautifulSoup(self.html_content, 'html.parser')
         services = []
         hierarchy_stack = []  # 階層スタック
 
@@ -72,6 +81,8 @@ class ServiceCatalogCreatorStep:
         self.output_json_path = step_config['output_json_path']
         self.url_mapping = self.load_mapping()
         self.services = []
+        # HTMLの解析結果のキャッシュ（指定した場合、再実行時は解析せずにキャッシュから読み込む）
+        self.parse_cache = ParseCache(step_config.get('parse_cache_dir'))
 
     def load_mapping(self):
         """マッピング情報を読み込む"""
@@ -89,15 +100,15 @@ class ServiceCatalogCreatorStep:
         unique_services = []
 
         for url, filepath in self.url_mapping.items():
-            if filepath.endswith('.html'):
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
-                creator = CatalogCreator(html_content, url)
+            if page_extension(filepath) == '.html':
+                html_content = read_page(filepath)
+                creator = CatalogCreator(html_content, url, self.parse_cache.page(html_content))
                 for service in creator.get_services():
                     service_hash = self.generate_hash(service['details'])
                     if service_hash not in unique_hashes:
                         unique_hashes.add(service_hash)
                         unique_services.append(service)
+        self.parse_cache.print_summary()
         self.services = unique_services
         self.save_services_to_json(self.output_json_path)
 
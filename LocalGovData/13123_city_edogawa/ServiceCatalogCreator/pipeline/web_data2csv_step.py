@@ -3,7 +3,9 @@ import json
 import yaml
 import hashlib
 import pandas as pd
-from bs4 import BeautifulSoup
+from lib.parse_cache import ParseCache
+from lib.page_store import page_extension, read_page
+from lib.table_extractor import extract_table, to_dataframe
 
 class ColumnManager:
     def __init__(self, yaml_path):
@@ -55,7 +57,7 @@ class ColumnManager:
         for child in node.children:
             service[child.title] = "  ".join(child.items)
 
-        node.tables.append(pd.DataFrame([service]))
+        node.add_frame(pd.DataFrame([service]))
             
 
 class Node:
@@ -66,6 +68,7 @@ class Node:
         self.children = []
         self.items = []
         self.tables = []
+        self.records = None # get_tables の結果のキャッシュ
 
     def add_child(self, child):
         # 新しい子ノードが追加される際、適切な親を見つける
@@ -79,29 +82,37 @@ class Node:
     def add_item(self, item):
         self.items.append(item)
 
+    # 表は行のリスト（extract_table の結果）で追加し、DataFrame は get_tables で必要になった時に作成する
     def add_table(self, table):
         print(f'add table (title = {self.title}, level={self.level})')
-        df = pd.read_html(str(table))[0]
+        self.tables.append(table if isinstance(table, dict) else extract_table(table))
+        self.records = None
+
+    def add_frame(self, df):
         self.tables.append(df)
+        self.records = None
 
+    # 全ての表を連結した行のリスト（最初に呼ばれた時に1回だけ作成する。repr で子孫のノードごとに何度も呼ばれる）
     def get_tables(self):
         if not self.tables:
             return {}
-        else:
-            return pd.concat(self.tables, ignore_index=True, sort=False).to_dict(orient='records')
+        if self.records is None:
+            frames = [to_dataframe(table) if isinstance(table, dict) else table for table in self.tables]
+            self.records = pd.concat(frames, ignore_index=True, sort=False).to_dict(orient='records')
+        return list(self.records)
 
     def __repr__(self):
         return f"Node(title='{self.title}', level={self.level}, items='{self.items[:30]}...', tables='{self.get_tables()}', children={self.children}\n)"
 
 
 class HtmlConverter:
-    def __init__(self, soup, url, column_manager):
-        self.soup = soup
+    def __init__(self, page, url, column_manager):
+        self.page = page
         self.url = url
         self.column_manager = column_manager
         self.root = Node('Root', level=0)
         self.current_node = self.root
-        self.parse_html_to_tree(self.soup.body)
+        self.parse_html_to_tree(self.page)
         self.apply_create_table(self.root)
 
     def apply_create_table(self, node):
@@ -109,25 +120,9 @@ class HtmlConverter:
         for child in node.children:
             self.apply_create_table(child)
 
-    def parse_html_to_tree(self, soup):
-        tags = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'table'], recursive=True)
-        for tag in tags:
-            if tag.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                level = int(tag.name[1])  # h1 -> 1, h2 -> 2, ...
-                new_node = Node(tag.get_text(strip=True), level)
-                if level > self.current_node.level:
-                    # 現在のノードが親ノードとして適切である場合
-                    self.current_node.add_child(new_node)
-                else:
-                    # 新しいノードが現在のノードのレベルと同じかそれ以上の場合、適切な親を見つける
-                    while self.current_node.level >= level:
-                        self.current_node = self.current_node.parent
-                    self.current_node.add_child(new_node)
-                self.current_node = new_node  # 更新された現在のノード
-            elif tag.name == 'table':
-                self.current_node.add_table(tag)
-            elif tag.name == 'p':
-                self.current_node.add_item(tag.get_text(strip=True))
+    # 見出し・表・段落を文書の順に1回だけたどって木を作成する（解析結果がキャッシュにあれば HTML を解析しない）
+    def parse_html_to_tree(self, page):
+        self.current_node = page.build_tree(self.root, item_tags=('p',))
 
     def display_tree(self, node=None, indent=0):
         if node is None:
@@ -157,6 +152,9 @@ class WebDataToCSVConvertStep:
         self.exclude_keywords = [keyword.strip() for keyword in exclude_keywords.split(",")] if exclude_keywords else []
         print(f"include / exclude : {self.include_keywords} / {self.exclude_keywords}")
 
+        # HTMLの解析結果のキャッシュ（指定した場合、再実行時や他のステップと解析結果を共有する）
+        self.parse_cache = ParseCache(step_config.get('parse_cache_dir'))
+
 
     def load_mapping(self):
         with open(self.progress_json_path, 'r') as file:
@@ -182,15 +180,14 @@ class WebDataToCSVConvertStep:
         service_json = None
 
         for url, filepath in self.url_mapping.items():
-            if filepath.endswith('.html'):
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
+            if page_extension(filepath) == '.html':
+                html_content = read_page(filepath)
 
-                soup = BeautifulSoup(html_content, 'html.parser')
+                page = self.parse_cache.page(html_content)
                 # キーワードチェック
-                if self.should_process(soup):
+                if self.should_process(page):
                     try:
-                        extractor = HtmlConverter(soup, url, self.column_manager)
+                        extractor = HtmlConverter(page, url, self.column_manager)
                         extractor.display_tree()
 
                         #service_json = extractor.extract_tables()
@@ -209,16 +206,15 @@ class WebDataToCSVConvertStep:
                 
                     
 
+        self.parse_cache.print_summary()
         #self.unique_services = unique_tables
         #self.save_table_to_json(self.output_json_dir)
 
-    def should_process(self, soup):
-        headers = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+    def should_process(self, page):
+        # 最初の見出しタグから終わりまでの内容（見出しごとに同じ内容を繰り返して連結しない）
+        relevant_content = page.text_from_first_heading()
 
-        if headers:
-            # 最初の見出しタグの次の兄弟要素から終わりまでの内容を抽出
-            relevant_content = ''.join(str(sibling) for header in headers for sibling in header.find_all_next(string=True))
-        else:
+        if relevant_content is None:
             # 見出しタグがない場合、すべてのコンテンツを評価
             #relevant_content = content
             # 見出しタグがない場合、処理をおこなわない
@@ -3,38 +3,24 @@ import json
 import yaml
 import hashlib
 import pandas as pd
-from bs4 import BeautifulSoup
 from lib.column_manager import ColumnManager
 from lib.htag_node import  HTagNode as Node
+from lib.parse_cache import ParseCache
+from lib.page_store import page_extension, read_page
 
 
 class HtmlConverter:
-    def __init__(self, soup, url):
-        self.soup = soup
+    def __init__(self, page, url):
+        self.page = page
         self.url = url
         self.root = Node('Root', level=0)
         self.current_node = self.root
-        self.parse_html_to_tree(self.soup.body)
-
-    def parse_html_to_tree(self, soup):
-        tags = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'table'], recursive=True)
-        for tag in tags:
-            if tag.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                level = int(tag.name[1])  # h1 -> 1, h2 -> 2, ...
-                new_node = Node(tag.get_text(strip=True), level)
-                if level > self.current_node.level:
-                    # 現在のノードが親ノードとして適切である場合
-                    self.current_node.add_child(new_node)
-                else:
-                    # 新しいノードが現在のノードのレベルと同じかそれ以上の場合、適切な親を見つける
-                    while self.current_node.level >= level:
-                        self.current_node = self.current_node.parent
-                    self.current_node.add_child(new_node)
-                self.current_node = new_node  # 更新された現在のノード
-            elif tag.name == 'table':
-                self.current_node.add_table(tag)
-            elif tag.name == 'p':
-                self.current_node.add_item(tag.get_text(strip=True))
+        self.parse_html_to_tree(self.page)
+
+    # 見出し・表・段落を文書の順に1回だけたどって木を作成する（入れ子の要素の文字列は外側の要素にまとめる）
+    # 解析結果がキャッシュにあれば HTML を解析せずに作成する
+    def parse_html_to_tree(self, page):
+        self.current_node = page.build_tree(self.root, item_tags=('p',))
 
     def display_tree(self, node=None, indent=0):
         if node is None:
@@ -64,6 +50,9 @@ class Html2HtagLayerStep:
         self.exclude_keywords = [keyword.strip() for keyword in exclude_keywords.split(",")] if exclude_keywords else []
         print(f"include / exclude : {self.include_keywords} / {self.exclude_keywords}")
 
+        # HTMLの解析結果のキャッシュ（指定した場合、再実行時や他のステップと解析結果を共有する）
+        self.parse_cache = ParseCache(step_config.get('parse_cache_dir'))
+
 
     def load_mapping(self):
         with open(self.progress_json_path, 'r') as file:
@@ -89,16 +78,15 @@ class Html2HtagLayerStep:
         service_json = None
 
         for url, filepath in self.url_mapping.items():
-            if filepath.endswith('.html'):
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
+            if page_extension(filepath) == '.html':
+                html_content = read_page(filepath)
 
-                soup = BeautifulSoup(html_content, 'html.parser')
+                page = self.parse_cache.page(html_content)
                 # キーワードチェック
-                if self.should_process(soup):
+                if self.should_process(page):
                     try:
                         #extractor = HtmlConverter(soup, url, self.column_manager)
-                        extractor = HtmlConverter(soup, url)
+                        extractor = HtmlConverter(page, url)
                         extractor.display_tree()
 
                         #service_json = extractor.extract_tables()
@@ -117,16 +105,15 @@ class Html2HtagLayerStep:
                 
                     
 
+        self.parse_cache.print_summary()
         #self.unique_services = unique_tables
         #self.save_table_to_json(self.output_json_dir)
 
-    def should_process(self, soup):
-        headers = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+    def should_process(self, page):
+        # 最初の見出しタグから終わりまでの内容（見出しごとに同じ内容を繰り返して連結しない）
+        relevant_content = page.text_from_first_heading()
 
-        if headers:
-            # 最初の見出しタグの次の兄弟要素から終わりまでの内容を抽出
-            relevant_content = ''.join(str(sibling) for header in headers for sibling in header.find_all_next(string=True))
-        else:
+        if relevant_content is None:
             # 見出しタグがない場合、すべてのコンテンツを評価
             #relevant_content = content
             # 見出しタグがない場合、処理をおこなわない
@@ -1,18 +1,56 @@
 import os
 import yaml
 import pandas as pd
-from bs4 import BeautifulSoup
+try:
+    from lib.table_extractor import extract_table, to_dataframe
+except ImportError:
+    from table_extractor import extract_table, to_dataframe
 
+# 見出しタグの階層構造のノード
+# ページごとに多数作成するため __slots__ で属性を固定し、インスタンスごとの __dict__ を持たない。
+# children / items / htag_tables / tables は最初の要素を追加するまで空のタプルを共有する（追加は add_child / add_item / add_table / add_htag_table で行う）。
+# tables は表の行のリスト（table_extractor.extract_table の結果）、htag_tables は見出しの階層から作成した表の行（辞書）で、
+# get_tables / get_htag_tables が最初に呼ばれた時に DataFrame にして1回だけ連結し、結果をキャッシュする（表を追加すると破棄する）。
+# get_content() の結果は th ごとにキャッシュし、タイトル・項目・子ノードを変更した場合は
+# このノードと祖先のキャッシュを破棄する（items / children を直接変更した場合は invalidate() を呼ぶ）。
 class HTagNode:
+    __slots__ = ('_title', 'level', 'parent', 'children', 'items', 'htag_tables', 'tables', '_content', '_records')
+
     def __init__(self, title, level, parent=None):
         #print(f'[new node] level = {level}, title = [{title}]')
-        self.title = title
+        self._content = None
+        self._records = None
         self.level = level
         self.parent = parent # 親ノードへの参照
-        self.children = []
-        self.items = []
-        self.htag_tables = []
-        self.tables = []
+        self.title = title
+        self.children = ()
+        self.items = ()
+        self.htag_tables = ()
+        self.tables = ()
+
+    @property
+    def title(self):
+        return self._title
+
+    @title.setter
+    def title(self, title):
+        self._title = title
+        self.invalidate()
+
+    # get_content() のキャッシュを、このノードと祖先について破棄する
+    def invalidate(self):
+        node = self
+        while node is not None:
+            node._content = None
+            node = node.parent
+
+    # このノードと子孫を行きがけ順に（再帰せずに）返す
+    def walk(self):
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            yield node
+            nodes.extend(reversed(node.children))
 
     def truncate_list_after_keyword(self, lst, keyword):
         if keyword in lst:
@@ -24,16 +62,36 @@ class HTagNode:
             # キーワードがリストにない場合は、元のリストをそのまま返す
             return lst
 
+    # ページ末尾の定型文以降を除く
+    def truncate_content(self, content_list):
+        return self.truncate_list_after_keyword(content_list, "このページを評価する")
+
+    # タイトル・項目と、レベルが th 未満の子孫のタイトル・項目を行きがけ順に並べたリスト（1文字以下は除く）
+    # 定型文が見つかったノードでは、それ以降の項目と子孫を含めない
+    # （各ノードで [title] + items + 子の結果 を連結して定型文以降を除く再帰的な処理と同じ結果になる。
+    #   子の結果は既に定型文以降を除いてあるため、連結後に除かれるのは自身のタイトル・項目の中の定型文だけ）
     def get_content(self, th=7):
-        content_list = []
-        child_content_list = []
-        if self.level >= th:
-            return content_list
-        for child in self.children:
-            child_content_list += child.get_content(th)
-        content_list = [self.title] + self.items + child_content_list
-        content_list = self.truncate_list_after_keyword(content_list, "このページを評価する")
-        return [s for s in content_list if len(s) > 1]
+        if self._content is None:
+            self._content = {}
+        content = self._content.get(th)
+        if content is None:
+            content = []
+            nodes = [self]
+            while nodes:
+                node = nodes.pop()
+                if node.level >= th:
+                    continue
+                cached = node._content.get(th) if node._content else None
+                if cached is not None:
+                    content += cached
+                    continue
+                own = [node.title, *node.items]
+                truncated = node.truncate_content(own)
+                content += [s for s in truncated if len(s) > 1]
+                if len(truncated) == len(own):
+                    nodes.extend(reversed(node.children))
+            self._content[th] = content
+        return list(content)
 
     def add_child(self, child):
         # 新しい子ノードが追加される際、適切な親を見つける
@@ -41,11 +99,19 @@ class HTagNode:
         while current_node.level >= child.level and current_node.parent is not None:
             current_node = current_node.parent
         # 適切な親ノードに子を追加
-        current_node.children.append(child)
+        if current_node.children:
+            current_node.children.append(child)
+        else:
+            current_node.children = [child]
         child.parent = current_node
+        current_node.invalidate()
 
     def add_item(self, item):
-        self.items.append(item)
+        if self.items:
+            self.items.append(item)
+        else:
+            self.items = [item]
+        self.invalidate()
 
     def matches_keywords(self, keywords):
         # タイトルが指定されたキーワードのいずれかにマッチするか確認
@@ -55,36 +121,59 @@ class HTagNode:
         # タイトルが指定されたキーワードのいずれかにマッチするか確認
         return any(keyword in self.title for keyword in keywords)
 
+    # 表を行のリストとキャプションに変換して追加する（DataFrame は get_tables で必要になった時に作成する）
+    # table は table の要素・HTML の文字列、または extract_table の結果（解析結果のキャッシュから木を作成した場合）
     def add_table(self, table):
-        # BeautifulSoupを使用してtableタグを解析
-        soup = BeautifulSoup(str(table), 'html.parser')
-        # captionを見つける
-        caption = soup.find('caption')
-        caption_text = caption.get_text(strip=True) if caption else "No caption"
-        
-        # tableをDataFrameに変換
-        df = pd.read_html(str(table))[0]
-        # DataFrameの既存の列の最後にcaption列を追加
-        df['caption'] = caption_text
-        #print(f'add table (title = {self.title}, caption = {caption_text}, level={self.level})')
-
-        # 変換したDataFrameをtablesリストに追加
-        self.tables.append(df)
+        data = table if isinstance(table, dict) else extract_table(table)
+        #print(f'add table (title = {self.title}, caption = {data["caption"]}, level={self.level})')
+        if self.tables:
+            self.tables.append(data)
+        else:
+            self.tables = [data]
+        self.clear_records()
+
+    # 見出しの階層から作成した表の1行（列名と値の辞書）を追加する
+    def add_htag_table(self, row):
+        if self.htag_tables:
+            self.htag_tables.append(row)
+        else:
+            self.htag_tables = [row]
+        self.clear_records()
+
+    # get_tables / get_htag_tables のキャッシュを破棄する（tables / htag_tables を直接変更した場合に呼ぶ）
+    def clear_records(self):
+        self._records = None
+
+    # name の表を連結した行のリスト（最初に呼ばれた時に concat() で作成してキャッシュする）
+    def records(self, name, concat):
+        if self._records is None:
+            self._records = {}
+        records = self._records.get(name)
+        if records is None:
+            records = self._records[name] = concat()
+        return list(records)
+
+    # 表の DataFrame（pd.read_html と同じ内容で、最後の列に caption を追加したもの）
+    def table_frame(self, data):
+        df = to_dataframe(data)
+        df['caption'] = data['caption'] if data['caption'] is not None else "No caption"
+        return df
 
     def get_htag_tables(self):
         if not self.htag_tables:
             return {}
         else:
-            return pd.concat(self.htag_tables, ignore_index=True, sort=False).to_dict(orient='records')
+            return self.records('htag_tables', lambda: pd.DataFrame(list(self.htag_tables)).to_dict(orient='records'))
 
     def get_tables(self):
         if not self.tables:
             return {}
         else:
-            return pd.concat(self.tables, ignore_index=True, sort=False).to_dict(orient='records')
+            return self.records('tables', lambda: pd.concat([self.table_frame(data) for data in self.tables],
+                                                            ignore_index=True, sort=False).to_dict(orient='records'))
 
     def __repr__(self):
-        return f"HTagNode(title='{self.title}', level={self.level}, items='{self.items[:3]}...', htag_tables='{self.get_htag_tables()}', tag_tables='{self.get_tables()}' \n)"
+        return f"HTagNode(title='{self.title}', level={self.level}, items='{list(self.items[:3])}...', htag_tables='{self.get_htag_tables()}', tag_tables='{self.get_tables()}' \n)"
         #return f"Node(title='{self.title}', level={self.level}, items='{self.items[:3]}...'\n)"
         #return f"Node(title='{self.title}', level={self.level}, items='{self.items[:30]}...', tables='{self.get_tables()}', children={self.children}\n)"
 
@@ -2,6 +2,7 @@ import pandas as pd
 import camelot
 import fitz  # PyMuPDF
 import glob
+import json
 import os
 
 
@@ -28,6 +29,13 @@ class DataExtractionStep:
         """
         # 指定されたフォルダ内の全てのPDFファイルを検索
         pdf_files = glob.glob(os.path.join(input_folder, '*.pdf'))
+        # download_summary を指定した場合は、ダウンロードで新規・更新されたPDFだけを処理する
+        summary_file = self.config.get('download_summary')
+        if summary_file and os.path.exists(summary_file):
+            with open(summary_file, 'r', encoding='utf-8') as f:
+                changed = set(json.load(f).get('changed', []))
+            pdf_files = [pdf_path for pdf_path in pdf_files if os.path.basename(pdf_path) in changed]
+            print(f"Processing {len(pdf_files)} new or changed PDF files")
     
         for pdf_path in pdf_files:
             self.process_pdf_file(pdf_path, output_folder)
@@ -3,8 +3,9 @@ import json
 import yaml
 import hashlib
 import pandas as pd
-from bs4 import BeautifulSoup
 from openai import OpenAI
+from lib.page_store import read_page
+from lib.parse_cache import ParseCache
 import logging
 
 # ロギングの設定
@@ -31,6 +32,9 @@ class OllamaStep:
         llm_prompt = self.load_llm_prompt(llm_prompt_file)
         self.ollama_client = OllamaClient(self.llm_url, self.llm_api_key, self.llm_model, llm_prompt)
 
+        # HTMLの解析結果のキャッシュ（html2htaglayer_step と同じディレクトリを指定すると、メインのdivを解析せずに読み込む）
+        self.parse_cache = ParseCache(step_config.get('parse_cache_dir'))
+
     def load_llm_prompt(self, llm_prompt_file):
         try:
             with open(llm_prompt_file, 'r', encoding='utf-8') as file:
@@ -58,8 +62,7 @@ class OllamaStep:
         # Check if URL exists in visited
         file_path = self.url_to_filepath.get(url)
         if file_path and os.path.exists(file_path):
-            with open(file_path, "r", encoding="utf-8") as file:
-                return file.read()
+            return read_page(file_path)
         else:
             return None
 
@@ -81,12 +84,12 @@ class OllamaStep:
                 html_content = self.get_file_content(url)
                 if html_content:
                     # Replace the '概要' field with the summary
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    main_div = soup.find('div', id='contents')
+                    main_div = self.parse_cache.page(html_content).main_html('contents')
                     entry["概要"] = self.ollama_client.create_summary(main_div)
             # 進捗の割合を計算して画面に表示する
             progress = (index + 1) / total_entries * 100
             logging.info(f"Progress: {progress:.2f}% ({index + 1}/{total_entries})")
+        self.parse_cache.print_summary()
         return data
 
     def execute(self):
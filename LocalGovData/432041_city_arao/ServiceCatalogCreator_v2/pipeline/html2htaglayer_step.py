@@ -3,45 +3,30 @@ import json
 import yaml
 import hashlib
 import pandas as pd
-from bs4 import BeautifulSoup
 from lib.htag_node import  HTagNode as Node
+from lib.parse_cache import ParseCache
+from lib.page_store import page_extension, read_page
 from openai import OpenAI
 import logging
 
 
 class HtmlConverter:
-    def __init__(self, soup, url, columns):
-        self.soup = soup
+    def __init__(self, page, url, columns):
+        self.page = page
         self.url = url
         self.root = Node('Root', level=0)
         self.current_node = self.root
         self.columns = columns
-        self.parse_html_to_tree(self.soup.body)
+        self.parse_html_to_tree(self.page)
         self.item_level = 6
         self.title = None
         self.sub_title = None
         self.summary = None
 
-    def parse_html_to_tree(self, soup):
-        tags = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'table', 'span', 'li'], recursive=True)
-        for tag in tags:
-            if tag.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                level = int(tag.name[1])  # h1 -> 1, h2 -> 2, ...
-                #print(f'[node dump] {str(tag)}')
-                new_node = Node(tag.get_text(strip=True), level)
-                if level > self.current_node.level:
-                    # 現在のノードが親ノードとして適切である場合
-                    self.current_node.add_child(new_node)
-                else:
-                    # 新しいノードが現在のノードのレベルと同じかそれ以上の場合、適切な親を見つける
-                    while self.current_node.level >= level:
-                        self.current_node = self.current_node.parent
-                    self.current_node.add_child(new_node)
-                self.current_node = new_node  # 更新された現在のノード
-            elif tag.name == 'table':
-                self.current_node.add_table(tag)
-            elif tag.name == 'p' or tag.name == 'span' or tag.name == 'li':
-                self.current_node.add_item(tag.get_text(strip=True))
+    # 見出し・表・段落を文書の順に1回だけたどって木を作成する（入れ子の要素の文字列は外側の要素にまとめる）
+    # 解析結果がキャッシュにあれば HTML を解析せずに作成する
+    def parse_html_to_tree(self, page):
+        self.current_node = page.build_tree(self.root, item_tags=('p', 'span', 'li'))
 
     def display_tree(self, node=None, indent=0):
         if node is None:
@@ -185,7 +170,10 @@ class Html2HtagLayerStep:
             self.llm_model,
             self.llm_prompt_file
         )
-        
+
+        # HTMLの解析結果のキャッシュ（指定した場合、再実行時や他のステップと解析結果を共有する）
+        self.parse_cache = ParseCache(step_config.get('parse_cache_dir'))
+
         os.makedirs(self.output_json_dir, exist_ok=True)
 
     def load_mapping(self):
@@ -208,16 +196,14 @@ class Html2HtagLayerStep:
         unique_services = []
 
         for url, filepath in self.url_mapping.items():
-            if filepath.endswith('.html'):
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
+            if page_extension(filepath) == '.html':
+                html_content = read_page(filepath)
 
-                soup = BeautifulSoup(html_content, 'html.parser')
-                main_div = soup.find('div', id='contents')
+                main_div = self.parse_cache.page(html_content).main_html('contents')
                 
                 if main_div:
                     # LLMを使用してHTMLをJSONに変換
-                    service_info = self.llm_converter.convert_html_to_json(str(main_div))
+                    service_info = self.llm_converter.convert_html_to_json(main_div)
                     
                     if service_info:
                         # URLを追加
@@ -233,6 +219,7 @@ class Html2HtagLayerStep:
                             unique_hashes.add(service_hash)
                             unique_services.append(service_info)
 
+        self.parse_cache.print_summary()
         # 結果を保存
         self.save_json(unique_services, self.output_json_dir)
 
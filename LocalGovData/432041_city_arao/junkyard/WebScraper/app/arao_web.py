@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import os
@@ -9,6 +8,7 @@ import mimetypes
 import chardet
 import urllib.robotparser
 import json  # Ensure json is imported
+from http_client import HttpClient
 
 class WebScraper:
     def __init__(self, start_url, user_agent='Mozilla/5.0', output_dir='./output', save_every=100, progress_file='progress.json'):
@@ -19,12 +19,18 @@ class WebScraper:
         self.visited = self.load_progress()
         self.counter = 0
         self.save_every = 100
+        self.http = HttpClient(self.user_agent)
 
     # 対象がスクレイピングOKか確認
     def is_allowed_url(self, url):
         parser = urllib.robotparser.RobotFileParser()
-        parser.set_url(urllib.parse.urljoin(url, '/robots.txt'))
-        parser.read()
+        response = self.http.get(urljoin(url, '/robots.txt'))
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif 400 <= response.status_code < 500:
+            parser.allow_all = True
+        elif response.status_code < 400:
+            parser.parse(response.text.splitlines())
         return parser.can_fetch(self.user_agent, url)
    
     # 進行状況を保存 
@@ -97,7 +103,7 @@ class WebScraper:
     
             try:
                 time.sleep(random.uniform(0.5, 1.5))  # Random delay to reduce server load
-                response = requests.get(current_url, headers={'User-Agent': self.user_agent})
+                response = self.http.get(current_url)
                 detected_encoding = chardet.detect(response.content)['encoding']
                 response.encoding = detected_encoding
 
@@ -117,6 +123,7 @@ class WebScraper:
                 continue
 
         print("\nScraping completed.")  # 最後に改行を入れて終了メッセージを表示 
+        self.http.print_summary()
 
 if __name__ == "__main__":
     start_url = os.getenv('TARGET_URL', 'https://www.city.arao.lg.jp/')
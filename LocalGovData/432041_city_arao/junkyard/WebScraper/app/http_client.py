@@ -0,0 +1,115 @@
+import time
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 新しいTCP(TLS)接続を張るたびに on_connect を呼び出すコネクションプールを作成する
+def counting_pool_classes(on_connect):
+    class CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            super().connect()
+            on_connect()
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            super().connect()
+            on_connect()
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = CountingHTTPConnection
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = CountingHTTPSConnection
+
+    return {'http': CountingHTTPConnectionPool, 'https': CountingHTTPSConnectionPool}
+
+# スクレイピング・ダウンロード処理で共有するHTTPクライアント
+#
+# requests.Session のコネクションプールを使い、同じホストへのリクエストでは
+# TCP/TLS の接続を使い回す（keep-alive）。Accept-Encoding は gzip/deflate に加え、
+# brotli がインストールされていれば br も送る。
+# リクエストごとの所要時間と新規接続の有無を記録し、summary() で集計できる。
+class HttpClient:
+    def __init__(self, user_agent=None, pool_connections=10, pool_maxsize=10, timeout=30, max_retries=0):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.adapter.poolmanager.pool_classes_by_scheme = counting_pool_classes(self.on_connect)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        self.timings = []
+        self.connections = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def on_connect(self):
+        self.local.connected = True
+        with self.lock:
+            self.connections += 1
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        self.local.connected = False
+        start = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.timings.append({
+                'url': url,
+                'status': response.status_code,
+                'elapsed': elapsed,
+                # 応答ヘッダを受け取るまでの時間
+                'ttfb': response.elapsed.total_seconds(),
+                'new_connection': self.local.connected,
+                'bytes': int(response.headers.get('Content-Length', 0) or 0) if kwargs.get('stream') else len(response.content)
+            })
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def summary(self):
+        with self.lock:
+            timings = list(self.timings)
+        if not timings:
+            return {'requests': 0}
+        elapsed = sorted(timing['elapsed'] for timing in timings)
+        return {
+            'requests': len(timings),
+            'connections': self.connections,
+            'new_connection_requests': sum(1 for timing in timings if timing['new_connection']),
+            'mean_elapsed': sum(elapsed) / len(elapsed),
+            'p50_elapsed': elapsed[len(elapsed) // 2],
+            'p95_elapsed': elapsed[min(len(elapsed) - 1, int(len(elapsed) * 0.95))],
+            'mean_ttfb': sum(timing['ttfb'] for timing in timings) / len(timings),
+            'bytes': sum(timing['bytes'] for timing in timings)
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        if summary['requests'] == 0:
+            return
+        print(f"HTTP: {summary['requests']} requests over {summary['connections']} connections, "
+              f"mean {summary['mean_elapsed'] * 1000:.1f} ms (p50 {summary['p50_elapsed'] * 1000:.1f} ms, "
+              f"p95 {summary['p95_elapsed'] * 1000:.1f} ms), {summary['bytes']} bytes")
+
+    # リクエストごとの計測結果をJSONLで保存する
+    def write_timings(self, path):
+        with self.lock:
+            timings = list(self.timings)
+        with open(path, 'w', encoding='utf-8') as file:
+            for timing in timings:
+                file.write(json.dumps(timing, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.session.close()